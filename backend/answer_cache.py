@@ -0,0 +1,105 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+import numpy as np
+
+
+class AnswerCache:
+    """Reuse answers to questions that mean the same thing as an earlier one.
+
+    Entries are grouped by scope (the documents a question was asked about, plus
+    anything else that changes the answer such as the search mode). A lookup
+    returns the cached answer of the most similar earlier question in the same
+    scope if its embedding's cosine similarity reaches `threshold`. Entries expire
+    after `ttl_seconds` and the least recently used are evicted beyond `max_entries`.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 3600.0, threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self._entries = OrderedDict()
+        # scope -> entry ids, so a lookup only compares questions about the same documents
+        self._scopes: Dict[Hashable, set] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._invalidated = 0
+
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+    def _remove(self, entry_id: str):
+        entry = self._entries.pop(entry_id)
+        entries = self._scopes[entry["scope"]]
+        entries.discard(entry_id)
+        if not entries:
+            del self._scopes[entry["scope"]]
+
+    def get(self, scope: Hashable, embedding: np.ndarray) -> Optional[Dict[str, Any]]:
+        """The cached answer for a similar question in scope, or None."""
+        embedding = self._normalize(embedding)
+        now = time.time()
+        with self._lock:
+            best_id, best_similarity = None, self.threshold
+            for entry_id in list(self._scopes.get(scope, ())):
+                entry = self._entries[entry_id]
+                if now - entry["created"] > self.ttl_seconds:
+                    self._remove(entry_id)
+                    continue
+                similarity = float(np.dot(entry["embedding"], embedding))
+                if similarity >= best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+
+            if best_id is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._entries.move_to_end(best_id)
+            return {**self._entries[best_id]["answer"], "similarity": round(best_similarity, 4)}
+
+    def put(self, scope: Hashable, embedding: np.ndarray, answer: Dict[str, Any], documents: Optional[set] = None):
+        """Cache an answer; documents are the ids whose deletion invalidates it (None: any document)."""
+        with self._lock:
+            entry_id = str(uuid.uuid4())
+            self._entries[entry_id] = {
+                "scope": scope,
+                "embedding": self._normalize(embedding),
+                "answer": answer,
+                "documents": documents,
+                "created": time.time(),
+            }
+            self._scopes.setdefault(scope, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, doc_id: Optional[str]) -> int:
+        """Drop answers that depend on doc_id (None: every answer), including corpus-wide ones. Returns how many."""
+        with self._lock:
+            stale = [
+                entry_id for entry_id, entry in self._entries.items()
+                if doc_id is None or entry["documents"] is None or doc_id in entry["documents"]
+            ]
+            for entry_id in stale:
+                self._remove(entry_id)
+            self._invalidated += len(stale)
+            return len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+                "invalidated": self._invalidated,
+                "threshold": self.threshold,
+                "ttl_seconds": self.ttl_seconds,
+            }
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class AudioCache:
+    """Disk cache of synthesized speech, keyed by a stable digest of its inputs.
+
+    Entries survive restarts (the directory is rescanned on startup) and the
+    least recently used files are evicted once the cache exceeds its byte budget.
+    """
+
+    _FILE_PATTERN = re.compile(r"^tts_([0-9a-f]{64})\.wav$")
+
+    def __init__(self, directory: str = "audio_output", max_bytes: int = 500 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # key -> (size in bytes, last access time), least recently used first
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._load_existing()
+
+    def _load_existing(self):
+        """Index files left by previous runs, using mtime as the last access time."""
+        found = []
+        for name in os.listdir(self.directory):
+            match = self._FILE_PATTERN.match(name)
+            if not match:
+                continue
+            stats = os.stat(os.path.join(self.directory, name))
+            found.append((stats.st_mtime, match.group(1), stats.st_size))
+
+        for mtime, key, size in sorted(found):
+            self._entries[key] = (size, mtime)
+            self._total_bytes += size
+
+        with self._lock:
+            self._evict()
+
+    @staticmethod
+    def make_key(text: str, model_name: str, sampling_rate: int) -> str:
+        """Stable digest of everything that determines the synthesized audio."""
+        payload = json.dumps([text, model_name, sampling_rate], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def path_for(self, key: str) -> str:
+        """File path an entry is stored under."""
+        return os.path.join(self.directory, f"tts_{key}.wav")
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached file for key, or None on a miss."""
+        path = self.path_for(key)
+        with self._lock:
+            if key in self._entries and os.path.exists(path):
+                now = time.time()
+                self._entries[key] = (self._entries[key][0], now)
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                if key in self._entries:
+                    # File was removed behind our back
+                    self._total_bytes -= self._entries.pop(key)[0]
+                self.misses += 1
+                return None
+
+        # Persist recency so LRU order survives a restart
+        try:
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+        return path
+
+    def add(self, key: str):
+        """Register a file that has just been written to path_for(key)."""
+        size = os.path.getsize(self.path_for(key))
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._entries[key][0]
+            self._entries[key] = (size, time.time())
+            self._entries.move_to_end(key)
+            self._total_bytes += size
+            self._evict(keep=key)
+
+    def _evict(self, keep: Optional[str] = None):
+        """Drop least recently used entries until the cache fits its budget."""
+        while self._total_bytes > self.max_bytes and self._entries:
+            key = next(iter(self._entries))
+            if key == keep:
+                break
+            size, _ = self._entries.pop(key)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self.path_for(key))
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Size, age and hit-rate counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            oldest = next(iter(self._entries.values()))[1] if self._entries else None
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "oldest_access_age_seconds": round(time.time() - oldest, 1) if oldest else None,
+            }
@@ -0,0 +1,145 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterable, Iterator, List
+
+
+class MicroBatcher:
+    """Collect items submitted from many threads and process them in batches.
+
+    The first item to arrive opens a window of `max_wait` seconds; everything
+    submitted before the window closes (up to `max_batch_size`) goes through one
+    call of `process_batch`, whose results are handed back to each caller.
+    """
+
+    def __init__(self, process_batch: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int = 8, max_wait: float = 0.02, name: str = "batcher"):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait)
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._queue_wait = 0.0
+        self._batch_time = 0.0
+        self._started_at = None
+
+    def _ensure_started(self):
+        # Start the worker lazily so nothing runs before the process is ready to serve
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._started_at = time.time()
+                self._thread = threading.Thread(target=self._run, name=f"{self.name}-thread", daemon=True)
+                self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        """Queue an item and return a future for its result."""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((item, future, time.time()))
+        return future
+
+    def process(self, item: Any) -> Any:
+        """Queue an item and block until its batch has been processed."""
+        return self.submit(item).result()
+
+    def _collect(self) -> List[tuple]:
+        batch = [self._queue.get()]
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.time()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            start_time = time.time()
+            try:
+                results = self.process_batch([item for item, _, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"{self.name}: expected {len(batch)} results, got {len(results)}")
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            finished = time.time()
+
+            with self._stats_lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._queue_wait += sum(start_time - enqueued for _, _, enqueued in batch)
+                self._batch_time += finished - start_time
+
+    def stats(self) -> Dict[str, Any]:
+        """Throughput and latency counters for tuning the batch window."""
+        with self._stats_lock:
+            batches, items = self._batches, self._items
+            uptime = time.time() - self._started_at if self._started_at else 0.0
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": round(self.max_wait * 1000, 2),
+                "batches": batches,
+                "items": items,
+                "queued": self._queue.qsize(),
+                "avg_batch_size": round(items / batches, 2) if batches else 0.0,
+                "avg_queue_wait_ms": round(self._queue_wait / items * 1000, 2) if items else 0.0,
+                "avg_batch_time_ms": round(self._batch_time / batches * 1000, 2) if batches else 0.0,
+                "items_per_second": round(items / uptime, 3) if uptime else 0.0,
+            }
+
+
+def prefetch(iterable: Iterable[Any], buffer_size: int = 32, name: str = "prefetch") -> Iterator[Any]:
+    """Consume an iterable on a background thread, keeping up to buffer_size items ready.
+
+    Lets a slow producer (e.g. document parsing) run concurrently with whatever
+    consumes its output. Exceptions raised by the producer are re-raised to the
+    consumer, and the producer stops if the consumer stops iterating.
+    """
+    items = queue.Queue(maxsize=max(1, buffer_size))
+    stop = threading.Event()
+
+    def put(kind: str, value: Any = None) -> bool:
+        while not stop.is_set():
+            try:
+                items.put((kind, value), timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put("item", item):
+                    return
+            put("end")
+        except Exception as e:
+            put("error", e)
+
+    threading.Thread(target=produce, name=f"{name}-thread", daemon=True).start()
+    try:
+        while True:
+            kind, value = items.get()
+            if kind == "end":
+                return
+            if kind == "error":
+                raise value
+            yield value
+    finally:
+        stop.set()
@@ -0,0 +1,51 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Use throwaway storage: the live embedding store would answer from earlier runs
+# instead of encoding, and the benchmark must not write into it
+BENCH_DIR = tempfile.mkdtemp(prefix="bench_embedding_")
+os.environ["EMBEDDING_STORE_PATH"] = os.path.join(BENCH_DIR, "embeddings.sqlite3")
+os.environ["VECTOR_STORAGE_PATH"] = BENCH_DIR
+
+from document_processor import DocumentProcessor
+from vector_engine import VectorEngine
+
+def bench_embedding(file_path: str):
+    print(f"Benchmarking embedding throughput on {file_path}...")
+    document = DocumentProcessor().process_document(file_path)
+    engine = VectorEngine()
+    chunks = engine._split_into_chunks(document["content"])
+    unique = len(set(chunks))
+    print(f"{len(chunks)} chunks ({unique} distinct)")
+
+    # Warm up the model so load time doesn't skew the first measurement
+    engine.model.encode(["warm up"])
+
+    # Previous behaviour: one encode call per chunk
+    start_time = time.time()
+    for chunk in chunks:
+        engine.model.encode(chunk).tolist()
+    per_chunk_time = time.time() - start_time
+    print(f"Per-chunk encode:   {per_chunk_time:.2f}s, {len(chunks) / per_chunk_time:.1f} chunks/sec")
+
+    # Batched, deduplicated encoding used by store_document
+    start_time = time.time()
+    engine._encode_chunks(chunks)
+    batched_time = time.time() - start_time
+    print(f"Batched encode:     {batched_time:.2f}s, {len(chunks) / batched_time:.1f} chunks/sec")
+    print(f"Speedup: {per_chunk_time / batched_time:.1f}x")
+    print(f"Batcher stats: {engine.embedding_batcher.stats()}")
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python benchmarks/bench_embedding.py <document.pdf>")
+        sys.exit(1)
+    try:
+        bench_embedding(sys.argv[1])
+    finally:
+        shutil.rmtree(BENCH_DIR, ignore_errors=True)
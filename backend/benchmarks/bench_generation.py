@@ -0,0 +1,89 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+from transformers import AutoTokenizer
+
+import config
+from context_packer import ContextPacker
+from generation_backends import BACKENDS, load_generation_model
+
+MODEL_NAME = "google/flan-t5-base"
+
+CONTEXT = [
+    {"content": "Invoice INV-2023-001 was issued to Acme Corp on 12 March 2023 for 4,250 USD. "
+                "Payment terms are net 30 days and the invoice was paid on 2 April 2023."},
+    {"content": "The quarterly report shows revenue of 1.2 million USD, up 8 percent from the previous "
+                "quarter, driven mainly by new contracts in the East region."},
+    {"content": "Support tickets fell by 15 percent after the new onboarding guide was published, "
+                "while average resolution time stayed at about two days."},
+]
+QUESTIONS = [
+    "Who was invoice INV-2023-001 issued to?",
+    "When was the invoice paid?",
+    "How much did revenue grow last quarter?",
+    "What happened to support tickets?",
+]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def bench_backend(backend: str, tokenizer, prompts, runs: int):
+    model, device = load_generation_model(MODEL_NAME, backend=backend, device="cpu", export_dir=config.ONNX_EXPORT_DIR)
+
+    def generate(input_ids):
+        inputs = tokenizer.pad({"input_ids": [input_ids]}, return_tensors="pt")
+        with torch.no_grad():
+            return model.generate(**inputs, max_length=300, do_sample=False, num_beams=1,
+                                  pad_token_id=tokenizer.eos_token_id, repetition_penalty=1.2)
+
+    # Warm up (and, for torch.compile, trigger compilation) outside the measurements
+    generate(prompts[0])
+
+    latencies = []
+    tokens = 0
+    for run in range(runs):
+        for input_ids in prompts:
+            start_time = time.time()
+            outputs = generate(input_ids)
+            latencies.append(time.time() - start_time)
+            tokens += int((outputs[0] != tokenizer.pad_token_id).sum())
+
+    total_time = sum(latencies)
+    print(f"{backend:8s} {tokens / total_time:8.1f} tokens/sec   "
+          f"p50 {percentile(latencies, 0.5) * 1000:7.1f} ms   p95 {percentile(latencies, 0.95) * 1000:7.1f} ms")
+    return tokens / total_time
+
+
+def bench_generation(backends, runs: int = 5):
+    print(f"Benchmarking generation backends {', '.join(backends)} ({runs} runs of {len(QUESTIONS)} prompts)...")
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    packer = ContextPacker(tokenizer, max_tokens=config.GENERATION_MAX_INPUT_TOKENS)
+    prompts = [packer.pack(question, CONTEXT)["input_ids"] for question in QUESTIONS]
+
+    results = {}
+    for backend in backends:
+        try:
+            results[backend] = bench_backend(backend, tokenizer, prompts, runs)
+        except Exception as e:
+            print(f"{backend:8s} failed: {e}")
+
+    if "pytorch" in results:
+        for backend, throughput in results.items():
+            if backend != "pytorch":
+                print(f"{backend} vs pytorch: {throughput / results['pytorch']:.2f}x")
+
+
+if __name__ == "__main__":
+    selected = sys.argv[1:] or list(BACKENDS)
+    unknown = [backend for backend in selected if backend not in BACKENDS]
+    if unknown:
+        print(f"Usage: python benchmarks/bench_generation.py [{' | '.join(BACKENDS)} ...]")
+        sys.exit(1)
+    bench_generation(selected)
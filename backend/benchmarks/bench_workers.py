@@ -0,0 +1,116 @@
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PORT = 8765
+URL = f"http://127.0.0.1:{PORT}"
+
+QUESTIONS = [
+    "What is this document about?",
+    "Summarize the main points.",
+    "Which dates are mentioned?",
+    "Who is the document addressed to?",
+    "What amounts or totals are listed?",
+    "Are there any deadlines?",
+    "What are the key findings?",
+    "Which organizations are mentioned?",
+]
+
+
+def memory_kb(pid: int):
+    """Resident and proportional set size of a process in kB (Linux only)."""
+    rss = pss = 0
+    with open(f"/proc/{pid}/smaps_rollup") as file:
+        for line in file:
+            if line.startswith("Rss:"):
+                rss = int(line.split()[1])
+            elif line.startswith("Pss:"):
+                pss = int(line.split()[1])
+    return rss, pss
+
+
+def worker_pids(master_pid: int):
+    with open(f"/proc/{master_pid}/task/{master_pid}/children") as file:
+        return [int(pid) for pid in file.read().split()]
+
+
+def wait_until_ready(server, timeout: float = 900):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        try:
+            with urllib.request.urlopen(f"{URL}/readyz", timeout=5) as response:
+                if response.status == 200:
+                    return
+        except (urllib.error.URLError, OSError):
+            pass
+        time.sleep(1)
+    raise RuntimeError("Server did not become ready")
+
+
+def ask(question: str, document_ids) -> float:
+    body = json.dumps({"text": question, "document_ids": document_ids, "profile": "fast"}).encode()
+    request = urllib.request.Request(f"{URL}/query", data=body, headers={"Content-Type": "application/json"})
+    start_time = time.time()
+    with urllib.request.urlopen(request, timeout=300) as response:
+        response.read()
+    return time.time() - start_time
+
+
+def bench_workers(workers: int, document_ids, requests: int, concurrency: int):
+    env = dict(os.environ, WEB_WORKERS=str(workers), BIND=f"127.0.0.1:{PORT}",
+               ANSWER_CACHE_ENABLED="false")
+    server = subprocess.Popen(["gunicorn", "-c", "gunicorn.conf.py", "main:app"], cwd=BACKEND_DIR, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_ready(server)
+        # Readiness is per worker, so make sure every one of them has loaded its engines
+        with ThreadPoolExecutor(max_workers=workers * 2) as executor:
+            list(executor.map(lambda i: ask(QUESTIONS[i % len(QUESTIONS)], document_ids), range(workers * 2)))
+
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(lambda i: ask(QUESTIONS[i % len(QUESTIONS)], document_ids),
+                                          range(requests)))
+        elapsed = time.time() - start_time
+
+        memory = [memory_kb(pid) for pid in worker_pids(server.pid)]
+        master_rss, master_pss = memory_kb(server.pid)
+        rss = sum(rss for rss, _ in memory) / len(memory) / 1024
+        pss = sum(pss for _, pss in memory) / len(memory) / 1024
+        total_pss = (master_pss + sum(pss for _, pss in memory)) / 1024
+        print(f"{workers:2d} workers   {requests / elapsed:6.2f} req/s   "
+              f"avg latency {sum(latencies) / len(latencies):6.2f} s   "
+              f"RSS/worker {rss:7.0f} MB   PSS/worker {pss:7.0f} MB   total PSS {total_pss:7.0f} MB")
+        return requests / elapsed
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count() or 1
+    document_ids = [sys.argv[2]] if len(sys.argv) > 2 else "all"
+    requests = 32
+    print(f"Benchmarking 1 to {max_workers} workers ({requests} /query requests each, "
+          f"documents: {document_ids})...")
+    print("RSS counts the shared model weights in every worker; PSS splits them between the processes sharing them.")
+
+    results = {}
+    for workers in range(1, max_workers + 1):
+        try:
+            results[workers] = bench_workers(workers, document_ids, requests, concurrency=workers * 4)
+        except Exception as e:
+            print(f"{workers:2d} workers   failed: {e}")
+
+    if 1 in results:
+        for workers, throughput in results.items():
+            if workers != 1:
+                print(f"{workers} workers vs 1: {throughput / results[1]:.2f}x")
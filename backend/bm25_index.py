@@ -0,0 +1,177 @@
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+_WORD = re.compile(r"[a-z0-9]+")
+# Identifiers such as invoice numbers or dates are also indexed whole
+_IDENTIFIER = re.compile(r"[a-z0-9]+(?:[-/._][a-z0-9]+)+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case word tokens plus whole compound identifiers."""
+    text = text.lower()
+    return _WORD.findall(text) + _IDENTIFIER.findall(text)
+
+
+class BM25Index:
+    """In-process BM25 inverted index over chunks, partitioned by document.
+
+    Each document keeps its own postings, so a query scoped to one document
+    only touches that document's terms, and a document's partition is saved to
+    (and deleted from) disk as a unit. With directory=None nothing is persisted.
+    """
+
+    def __init__(self, directory: Optional[str] = "vector_storage/bm25", k1: float = 1.5, b: float = 0.75):
+        self.directory = directory
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        # doc_id -> {"postings": {term: {chunk_id: tf}}, "lengths": {chunk_id: token count}}
+        self._documents: Dict[str, Dict[str, Dict]] = {}
+        # Corpus-wide statistics needed for idf and length normalization
+        self._document_frequency: Counter = Counter()
+        self._chunk_count = 0
+        self._total_length = 0
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._load()
+
+    def _path(self, doc_id: str) -> str:
+        return os.path.join(self.directory, f"{doc_id}.json")
+
+    def _load(self):
+        start_time = time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            self._load_document(name[:-len(".json")])
+        print(f"Keyword index loaded {len(self._documents)} documents in {time.time() - start_time:.2f} seconds")
+
+    def _load_document(self, doc_id: str):
+        try:
+            with open(self._path(doc_id), "r", encoding="utf-8") as file:
+                partition = json.load(file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Skipping unreadable keyword index {doc_id}.json: {e}")
+            return
+        self._register(doc_id, partition)
+
+    def _register(self, doc_id: str, partition: Dict[str, Dict]):
+        self._documents[doc_id] = partition
+        for term, postings in partition["postings"].items():
+            self._document_frequency[term] += len(postings)
+        self._chunk_count += len(partition["lengths"])
+        self._total_length += sum(partition["lengths"].values())
+
+    def _unregister(self, doc_id: str):
+        partition = self._documents.pop(doc_id, None)
+        if partition:
+            for term, postings in partition["postings"].items():
+                self._document_frequency[term] -= len(postings)
+                if self._document_frequency[term] <= 0:
+                    del self._document_frequency[term]
+            self._chunk_count -= len(partition["lengths"])
+            self._total_length -= sum(partition["lengths"].values())
+
+    def reload_document(self, doc_id: str):
+        """Re-read a document's partition, which another process may have saved or removed."""
+        if not self.directory:
+            return
+        with self._lock:
+            self._unregister(doc_id)
+            self._load_document(doc_id)
+
+    def reload(self):
+        """Re-read every partition from disk."""
+        if not self.directory:
+            return
+        with self._lock:
+            self._documents = {}
+            self._document_frequency = Counter()
+            self._chunk_count = 0
+            self._total_length = 0
+            self._load()
+
+    def has_document(self, doc_id: str) -> bool:
+        with self._lock:
+            return doc_id in self._documents
+
+    def add_chunks(self, doc_id: str, chunk_ids: Iterable[str], texts: Iterable[str]):
+        """Index chunks of a document; call save_document once the document is complete."""
+        with self._lock:
+            partition = self._documents.setdefault(doc_id, {"postings": {}, "lengths": {}})
+            for chunk_id, text in zip(chunk_ids, texts):
+                tokens = tokenize(text)
+                partition["lengths"][chunk_id] = len(tokens)
+                self._chunk_count += 1
+                self._total_length += len(tokens)
+                for term, frequency in Counter(tokens).items():
+                    partition["postings"].setdefault(term, {})[chunk_id] = frequency
+                    self._document_frequency[term] += 1
+
+    def save_document(self, doc_id: str):
+        """Write a document's partition to disk."""
+        if not self.directory:
+            return
+        with self._lock:
+            partition = json.dumps(self._documents[doc_id])
+        path = self._path(doc_id)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+            file.write(partition)
+        os.replace(f"{path}.tmp", path)
+
+    def remove_document(self, doc_id: str):
+        """Drop a document from the index and from disk."""
+        with self._lock:
+            self._unregister(doc_id)
+        if not self.directory:
+            return
+        try:
+            os.remove(self._path(doc_id))
+        except OSError:
+            pass
+
+    def search(self, query: str, top_k: int = 5, doc_ids: Optional[Iterable[str]] = None) -> List[Tuple[str, float]]:
+        """Return (chunk_id, score) pairs for the best matching chunks."""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        scores: Counter = Counter()
+        with self._lock:
+            if not self._chunk_count:
+                return []
+            average_length = self._total_length / self._chunk_count
+            idf = {
+                term: math.log(1 + (self._chunk_count - self._document_frequency[term] + 0.5)
+                               / (self._document_frequency[term] + 0.5))
+                for term in terms if self._document_frequency.get(term)
+            }
+            partitions = (
+                [self._documents[doc_id] for doc_id in doc_ids if doc_id in self._documents]
+                if doc_ids is not None else list(self._documents.values())
+            )
+            for partition in partitions:
+                lengths = partition["lengths"]
+                for term, term_idf in idf.items():
+                    for chunk_id, frequency in partition["postings"].get(term, {}).items():
+                        norm = self.k1 * (1 - self.b + self.b * lengths[chunk_id] / average_length)
+                        scores[chunk_id] += term_idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        return scores.most_common(top_k)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "documents": len(self._documents),
+                "chunks": self._chunk_count,
+                "terms": len(self._document_frequency),
+            }
@@ -0,0 +1,178 @@
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    """Read an integer setting from the environment."""
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    """Read a float setting from the environment."""
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    """Read a boolean setting from the environment."""
+    value = os.getenv(name)
+    if not value:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Server processes started by gunicorn.conf.py; the model weights are loaded once in
+# the parent before forking and shared by all of them
+WEB_WORKERS = _env_int("WEB_WORKERS", 1)
+
+# CPU cores each server process gets; gunicorn.conf.py sets torch's thread count to this
+CPU_THREADS = _env_int("CPU_THREADS", max(1, (os.cpu_count() or 1) // WEB_WORKERS))
+
+# Micro-batching of concurrent generate calls
+GENERATION_MAX_BATCH_SIZE = _env_int("GENERATION_MAX_BATCH_SIZE", 8)
+GENERATION_MAX_WAIT_MS = _env_float("GENERATION_MAX_WAIT_MS", 20.0)
+
+# Inference worker pools: concurrent workers and queued jobs allowed per stage.
+# Generation workers only wait on the batcher, which runs one generate call (using
+# all CPU_THREADS) at a time, so more of them than the batch size never helps; the
+# default leaves small machines fewer waiting requests
+PARSING_WORKERS = _env_int("PARSING_WORKERS", 2)
+PARSING_QUEUE_SIZE = _env_int("PARSING_QUEUE_SIZE", 8)
+EMBEDDING_WORKERS = _env_int("EMBEDDING_WORKERS", 2)
+EMBEDDING_QUEUE_SIZE = _env_int("EMBEDDING_QUEUE_SIZE", 16)
+GENERATION_WORKERS = _env_int("GENERATION_WORKERS", max(2, min(GENERATION_MAX_BATCH_SIZE, CPU_THREADS)))
+GENERATION_QUEUE_SIZE = _env_int("GENERATION_QUEUE_SIZE", 8)
+# Streamed answers each run their own generate call on all CPU_THREADS, so only a
+# few run at once and the rest wait their turn
+STREAMING_WORKERS = _env_int("STREAMING_WORKERS", max(1, CPU_THREADS // 4))
+STREAMING_QUEUE_SIZE = _env_int("STREAMING_QUEUE_SIZE", 8)
+TTS_WORKERS = _env_int("TTS_WORKERS", 1)
+TTS_QUEUE_SIZE = _env_int("TTS_QUEUE_SIZE", 8)
+STT_WORKERS = _env_int("STT_WORKERS", 4)
+STT_QUEUE_SIZE = _env_int("STT_QUEUE_SIZE", 8)
+
+# Seconds clients are told to wait (Retry-After) when a stage is saturated
+RETRY_AFTER_SECONDS = _env_int("RETRY_AFTER_SECONDS", 5)
+
+# Longest pause between streamed tokens before a stream is abandoned
+STREAM_TOKEN_TIMEOUT_SECONDS = _env_float("STREAM_TOKEN_TIMEOUT_SECONDS", 60.0)
+
+# Sentences synthesized per VITS forward pass when streaming speech
+TTS_STREAM_BATCH_SIZE = _env_int("TTS_STREAM_BATCH_SIZE", 4)
+
+# Disk budget for cached text-to-speech audio
+TTS_CACHE_MAX_BYTES = _env_int("TTS_CACHE_MAX_BYTES", 500 * 1024 * 1024)
+
+# Embedding batches shared by concurrent uploads
+EMBEDDING_BATCH_SIZE = _env_int("EMBEDDING_BATCH_SIZE", 64)
+EMBEDDING_MAX_WAIT_MS = _env_float("EMBEDDING_MAX_WAIT_MS", 10.0)
+QUERY_EMBEDDING_CACHE_SIZE = _env_int("QUERY_EMBEDDING_CACHE_SIZE", 1000)
+
+# Persistent cache of chunk embeddings and ingested file hashes
+EMBEDDING_STORE_PATH = os.getenv("EMBEDDING_STORE_PATH", "vector_storage/embeddings.sqlite3")
+
+# Vector store: "persistent" keeps the index on disk, "memory" is lost on restart, and
+# "http" uses the Chroma server at CHROMA_HOST:CHROMA_PORT, which is what several server
+# processes (WEB_WORKERS > 1) need to share one corpus. The keyword index and the
+# embedding store stay under VECTOR_STORAGE_PATH either way
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "persistent")
+VECTOR_STORAGE_PATH = os.getenv("VECTOR_STORAGE_PATH", "vector_storage")
+CHROMA_HOST = os.getenv("CHROMA_HOST", "localhost")
+CHROMA_PORT = _env_int("CHROMA_PORT", 8001)
+WARM_START_BUDGET_SECONDS = _env_float("WARM_START_BUDGET_SECONDS", 30.0)
+
+# Background ingestion jobs processed at the same time
+INGEST_WORKERS = _env_int("INGEST_WORKERS", 2)
+
+# PDF extraction: worker processes, smallest document worth a pool, OCR resolution
+PDF_WORKERS = _env_int("PDF_WORKERS", max(1, (os.cpu_count() or 2) // 2))
+PDF_POOL_MIN_PAGES = _env_int("PDF_POOL_MIN_PAGES", 8)
+PDF_OCR_DPI = _env_int("PDF_OCR_DPI", 300)
+
+# Streaming ingestion: parsed blocks buffered ahead of embedding, chunks per insert batch
+INGEST_PREFETCH_BLOCKS = _env_int("INGEST_PREFETCH_BLOCKS", 64)
+INGEST_BATCH_CHUNKS = _env_int("INGEST_BATCH_CHUNKS", 256)
+
+# Spreadsheet ingestion: rows read per step, characters per row-group chunk,
+# streaming read-only openpyxl for .xlsx, and an optional pandas engine override
+EXCEL_READ_ROWS = _env_int("EXCEL_READ_ROWS", 10000)
+EXCEL_CHUNK_CHARS = _env_int("EXCEL_CHUNK_CHARS", 500)
+EXCEL_STREAMING = _env_bool("EXCEL_STREAMING", True)
+EXCEL_ENGINE = os.getenv("EXCEL_ENGINE", "")
+
+# Columnar copies of spreadsheets used to answer aggregate questions
+TABLE_STORAGE_PATH = os.getenv("TABLE_STORAGE_PATH", "table_storage")
+
+# Retrieval: default search mode ("vector", "keyword" or "hybrid"), candidates
+# taken from each ranking before fusion, the reciprocal-rank fusion constant,
+# and where the keyword index is kept
+SEARCH_MODE = os.getenv("SEARCH_MODE", "hybrid")
+HYBRID_CANDIDATES = _env_int("HYBRID_CANDIDATES", 20)
+RRF_K = _env_int("RRF_K", 60)
+KEYWORD_INDEX_PATH = os.getenv("KEYWORD_INDEX_PATH", os.path.join(VECTOR_STORAGE_PATH, "bm25"))
+
+# Cross-encoder reranking: candidates fetched for reranking, chunks kept after it,
+# prediction batch size and cached (query, chunk) scores
+RERANK_ENABLED = _env_bool("RERANK_ENABLED", True)
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = _env_int("RERANK_CANDIDATES", 50)
+RERANK_TOP_K = _env_int("RERANK_TOP_K", 3)
+RERANK_BATCH_SIZE = _env_int("RERANK_BATCH_SIZE", 16)
+RERANK_CACHE_SIZE = _env_int("RERANK_CACHE_SIZE", 10000)
+
+# Collections documents are spread over by a hash of their id; corpus-wide queries search
+# all of them. Don't change once documents are stored, they would be looked up in the wrong shard.
+VECTOR_SHARDS = _env_int("VECTOR_SHARDS", 8)
+
+# Threads searching the shards of a query in parallel
+SEARCH_WORKERS = _env_int("SEARCH_WORKERS", 8)
+
+# Semantic answer cache: entries kept, their lifetime, and the cosine similarity a
+# new question needs to an earlier one about the same documents to reuse its answer
+ANSWER_CACHE_ENABLED = _env_bool("ANSWER_CACHE_ENABLED", True)
+ANSWER_CACHE_SIZE = _env_int("ANSWER_CACHE_SIZE", 1000)
+ANSWER_CACHE_TTL_SECONDS = _env_float("ANSWER_CACHE_TTL_SECONDS", 3600.0)
+ANSWER_CACHE_THRESHOLD = _env_float("ANSWER_CACHE_THRESHOLD", 0.95)
+
+# Generation prompts: input tokens the model was trained with (flan-t5: 512) and
+# tokenized chunks cached for prompt packing
+GENERATION_MAX_INPUT_TOKENS = _env_int("GENERATION_MAX_INPUT_TOKENS", 512)
+CONTEXT_TOKEN_CACHE_SIZE = _env_int("CONTEXT_TOKEN_CACHE_SIZE", 4096)
+
+# Generation model backend: "pytorch", "int8" (dynamic quantization, CPU),
+# "onnx" (ONNX Runtime via optimum, exported once to ONNX_EXPORT_DIR) or "compile" (torch.compile)
+GENERATION_BACKEND = os.getenv("GENERATION_BACKEND", "pytorch")
+ONNX_EXPORT_DIR = os.getenv("ONNX_EXPORT_DIR", os.path.join("model_cache", "onnx"))
+
+# Decoding profile when a query doesn't name one: "fast", "balanced", "quality",
+# "creative", or "auto" to step down from quality as the generation stage's load
+# (share of its workers and queue in use) reaches these levels
+GENERATION_PROFILE = os.getenv("GENERATION_PROFILE", "auto")
+PROFILE_BALANCED_LOAD = _env_float("PROFILE_BALANCED_LOAD", 0.5)
+PROFILE_FAST_LOAD = _env_float("PROFILE_FAST_LOAD", 0.8)
+
+# Model-backed engines to run ("vector", "nlp", "voice"); disabled engines are never
+# loaded and their endpoints answer 503. With ENGINE_WARMUP the enabled engines are
+# loaded in the background after startup, otherwise each loads on first use.
+ENABLED_ENGINES = [
+    name.strip() for name in os.getenv("ENABLED_ENGINES", "vector,nlp,voice").split(",") if name.strip()
+]
+ENGINE_WARMUP = _env_bool("ENGINE_WARMUP", True)
+
+# Speech-to-text: recordings are transcribed in windows of STT_CHUNK_SECONDS that overlap
+# by twice STT_STRIDE_SECONDS, up to STT_BATCH_SIZE windows (from any requests) per pass
+STT_CHUNK_SECONDS = _env_float("STT_CHUNK_SECONDS", 20.0)
+STT_STRIDE_SECONDS = _env_float("STT_STRIDE_SECONDS", 2.0)
+STT_BATCH_SIZE = _env_int("STT_BATCH_SIZE", 8)
+STT_MAX_WAIT_MS = _env_float("STT_MAX_WAIT_MS", 20.0)
+
+# Live speech recognition (/ws/speech-to-text): frames whose RMS level is at least
+# STT_VAD_THRESHOLD_DB (dBFS) count as speech; an utterance ends after STT_VAD_SILENCE_MS
+# of silence and is dropped if it has less than STT_VAD_MIN_SPEECH_MS of speech.
+# Partial transcripts are decoded after every STT_PARTIAL_INTERVAL_MS of new audio.
+STT_STREAM_FRAME_MS = _env_int("STT_STREAM_FRAME_MS", 30)
+STT_VAD_THRESHOLD_DB = _env_float("STT_VAD_THRESHOLD_DB", -45.0)
+STT_VAD_SILENCE_MS = _env_int("STT_VAD_SILENCE_MS", 700)
+STT_VAD_MIN_SPEECH_MS = _env_int("STT_VAD_MIN_SPEECH_MS", 150)
+STT_VAD_PREROLL_MS = _env_int("STT_VAD_PREROLL_MS", 300)
+STT_PARTIAL_INTERVAL_MS = _env_int("STT_PARTIAL_INTERVAL_MS", 500)
@@ -0,0 +1,116 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List
+
+
+class ContextPacker:
+    """Fit retrieved chunks and the question into the model's input token budget.
+
+    Chunks are added most relevant first until the budget is used up, the last one
+    possibly cut short; the question is always kept whole. The result is a list of
+    token ids, so the prompt isn't tokenized (or silently truncated) a second time.
+    Tokenized chunks are cached, as the same chunks come back for related questions.
+    """
+
+    INSTRUCTION = (
+        "Based on the above context, please provide a complete and comprehensive answer. "
+        "If the question asks for a list, make sure to include ALL items from the context. "
+        "If the answer cannot be found in the context, say so."
+    )
+
+    def __init__(self, tokenizer, max_tokens: int = 512, cache_size: int = 4096, min_partial_tokens: int = 32):
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.cache_size = cache_size
+        self.min_partial_tokens = min_partial_tokens
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+        self._prefix = self._tokenize("Context:")
+        self._separator = self._tokenize("\n")
+        self._instruction = self._tokenize(self.INSTRUCTION)
+        self._answer = self._tokenize("Answer:")
+        self._special_tokens = tokenizer.num_special_tokens_to_add(pair=False)
+
+    def _tokenize(self, text: str) -> List[int]:
+        return self.tokenizer(text, add_special_tokens=False)["input_ids"]
+
+    def _tokenize_chunk(self, text: str) -> List[int]:
+        with self._lock:
+            if text in self._cache:
+                self._cache.move_to_end(text)
+                self._hits += 1
+                return self._cache[text]
+            self._misses += 1
+
+        ids = self._tokenize(text)
+        with self._lock:
+            self._cache[text] = ids
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return ids
+
+    @staticmethod
+    def _by_relevance(context: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Most relevant chunks first, using whichever score retrieval attached."""
+        if all("rerank_score" in item for item in context):
+            return sorted(context, key=lambda item: item["rerank_score"], reverse=True)
+        if all(item.get("score") is not None for item in context):
+            return sorted(context, key=lambda item: item["score"], reverse=True)
+        if all(item.get("distance") is not None for item in context):
+            return sorted(context, key=lambda item: item["distance"])
+        return list(context)
+
+    def pack(self, query: str, context: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Build the prompt as token ids.
+
+        Returns {"input_ids", "prompt" (the decoded prompt), "context_text",
+        "chunks_used", "chunks_total", "tokens"}.
+        """
+        question = self._tokenize(f"Question: {query}")
+        suffix = self._separator + question + self._separator + self._instruction + self._separator + self._answer
+        budget = self.max_tokens - self._special_tokens - len(self._prefix)
+        if len(suffix) > budget:
+            # Drop the instruction before ever touching the question
+            suffix = self._separator + question + self._separator + self._answer
+        if len(suffix) > budget:
+            suffix = question[:budget]
+        budget -= len(suffix)
+
+        context_ids = []
+        used_texts = []
+        for item in self._by_relevance(context):
+            chunk = self._tokenize_chunk(item["content"])
+            cost = len(chunk) + (len(self._separator) if context_ids else 0)
+            if cost <= budget:
+                context_ids += (self._separator if context_ids else []) + chunk
+                used_texts.append(item["content"])
+                budget -= cost
+                continue
+            # Use what's left of the budget for part of the next chunk, if worth it
+            room = budget - (len(self._separator) if context_ids else 0)
+            if room >= self.min_partial_tokens:
+                context_ids += (self._separator if context_ids else []) + chunk[:room]
+                used_texts.append(self.tokenizer.decode(chunk[:room], skip_special_tokens=True))
+            break
+
+        input_ids = self.tokenizer.build_inputs_with_special_tokens(self._prefix + context_ids + suffix)
+        return {
+            "input_ids": input_ids,
+            "prompt": self.tokenizer.decode(input_ids, skip_special_tokens=True),
+            "context_text": "\n".join(used_texts),
+            "chunks_used": len(used_texts),
+            "chunks_total": len(context),
+            "tokens": len(input_ids),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "max_tokens": self.max_tokens,
+                "cached_chunks": len(self._cache),
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+            }
@@ -1,29 +1,57 @@
 import os
-from typing import Dict, Any
+import hashlib
+from typing import Dict, Any, Callable, Iterable, Iterator, Optional, Tuple
 import PyPDF2
+import numpy as np
+import openpyxl
 import pandas as pd
 from docx import Document
 from PIL import Image
 import pytesseract
 import json
 import re
+import time
+import config
+from pdf_extractor import PdfExtractor
+from table_engine import TableStore
 from datetime import datetime
 
+# Patterns used to clean extracted text, compiled once
+_WHITESPACE = re.compile(r'\s+')
+# "/" stays so part numbers, paths and dates are indexed whole (see bm25_index.tokenize)
+_SPECIAL_CHARACTERS = re.compile(r'[^\w\s.,!?;:()\-\'"/]')
+_SPACE_BEFORE_PUNCTUATION = re.compile(r'\s+([.,!?;:])')
+_PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+
 class DocumentProcessor:
     def __init__(self):
+        # Each extractor yields the document as a sequence of {"text": ..., "page": ...} blocks;
+        # blocks marked "standalone" are kept as chunks of their own
         self.supported_extensions = {
-            '.pdf': self._process_pdf,
-            '.docx': self._process_docx,
-            '.xlsx': self._process_excel,
-            '.xls': self._process_excel,
-            '.txt': self._process_text,
-            '.jpg': self._process_image,
-            '.jpeg': self._process_image,
-            '.png': self._process_image
+            '.pdf': self._iter_pdf_blocks,
+            '.docx': self._iter_docx_blocks,
+            '.xlsx': self._iter_excel_blocks,
+            '.xls': self._iter_excel_blocks,
+            '.txt': self._iter_text_blocks,
+            '.jpg': self._iter_image_blocks,
+            '.jpeg': self._iter_image_blocks,
+            '.png': self._iter_image_blocks
         }
+        self.pdf_extractor = PdfExtractor(
+            workers=config.PDF_WORKERS,
+            min_pages_for_pool=config.PDF_POOL_MIN_PAGES,
+            ocr_dpi=config.PDF_OCR_DPI
+        )
+        # Spreadsheets are also kept as columnar tables for structured queries
+        self.table_store = TableStore(config.TABLE_STORAGE_PATH)
+
+    def stream_document(self, file_path: str, progress: Optional[Callable[..., None]] = None) -> Tuple[Dict[str, Any], Iterator[Dict[str, Any]]]:
+        """Open a document for streaming ingestion.
 
-    def process_document(self, file_path: str) -> Dict[str, Any]:
-        """Process a document and return its content in a structured format."""
+        Returns the document's details (without content) and a lazy iterator of
+        cleaned text blocks, so the whole text never has to sit in memory at once.
+        progress, if given, is called with counters such as pages_parsed as blocks are produced.
+        """
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"File not found: {file_path}")
 
@@ -32,91 +60,217 @@ class DocumentProcessor:
         if file_extension not in self.supported_extensions:
             raise ValueError(f"Unsupported file type: {file_extension}")
 
-        processor = self.supported_extensions[file_extension]
-        content = processor(file_path)
-        
-        # Clean and preprocess the content
-        content = self._clean_content(content)
-
-        return {
+        extractor = self.supported_extensions[file_extension]
+        document = {
             "file_name": os.path.basename(file_path),
             "file_type": file_extension,
-            "content": content,
             "metadata": self._extract_metadata(file_path)
         }
+        return document, self._iter_clean_blocks(extractor(file_path, progress))
+
+    def process_document(self, file_path: str, progress: Optional[Callable[..., None]] = None) -> Dict[str, Any]:
+        """Process a document and return its content in a structured format.
+
+        progress, if given, is called with counters such as pages_parsed as work proceeds.
+        """
+        document, blocks = self.stream_document(file_path, progress)
+        document["content"] = "\n\n".join(block["text"] for block in blocks)
+        return document
+
+    def persist_tables(self, file_path: str, doc_id: str) -> bool:
+        """Save a spreadsheet's sheets to the columnar table store under doc_id.
+
+        Returns False for files that aren't spreadsheets.
+        """
+        if os.path.splitext(file_path)[1].lower() not in ('.xlsx', '.xls'):
+            return False
+        if not self.table_store.has(doc_id):
+            self.table_store.save(doc_id, self._iter_sheet_frames(file_path))
+        return True
+
+    def _iter_clean_blocks(self, blocks: Iterator[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Clean blocks one at a time, dropping those left empty."""
+        for block in blocks:
+            text = self._clean_content(block["text"])
+            if text:
+                yield {**block, "text": text}
 
     def _clean_content(self, content: str) -> str:
         """Clean and preprocess the extracted content."""
-        # Remove extra whitespace
-        content = re.sub(r'\s+', ' ', content)
+        # Remove extra whitespace (this also folds newlines, so no paragraph pass is needed)
+        content = _WHITESPACE.sub(' ', content)
         
         # Remove special characters but keep important punctuation
-        content = re.sub(r'[^\w\s.,!?;:()\-\'"]', ' ', content)
+        content = _SPECIAL_CHARACTERS.sub(' ', content)
         
         # Fix spacing around punctuation
-        content = re.sub(r'\s+([.,!?;:])', r'\1', content)
-        
-        # Remove multiple newlines
-        content = re.sub(r'\n\s*\n', '\n\n', content)
+        content = _SPACE_BEFORE_PUNCTUATION.sub(r'\1', content)
         
         # Remove leading/trailing whitespace
-        content = content.strip()
-        
-        # Ensure proper paragraph separation
-        content = re.sub(r'\n\s*\n', '\n\n', content)
+        return content.strip()
+
+    def _split_paragraphs(self, text: str, page: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """Turn a piece of text into one block per paragraph."""
+        for paragraph in _PARAGRAPH_BREAK.split(text):
+            if paragraph.strip():
+                yield {"text": paragraph, "page": page}
+
+    def _iter_pdf_blocks(self, file_path: str, progress: Optional[Callable[..., None]] = None) -> Iterator[Dict[str, Any]]:
+        """Extract text from PDF files, page by page in parallel with OCR for scanned pages."""
+        start_time = time.time()
+        pages_total = self.pdf_extractor.page_count(file_path)
+        ocr_pages = 0
+        slowest = None
+        for page in self.pdf_extractor.iter_pages(file_path, pages_total):
+            yield from self._split_paragraphs(page["text"], page["page"])
+            ocr_pages += page["ocr"]
+            if slowest is None or page["seconds"] > slowest["seconds"]:
+                slowest = page
+            if progress:
+                progress(pages_parsed=page["page"], pages_total=pages_total, ocr_pages=ocr_pages)
         
-        return content
+        processing_time = time.time() - start_time
+        if pages_total:
+            print(f"PDF extraction took {processing_time:.2f} seconds for {pages_total} pages "
+                  f"({ocr_pages} OCR, slowest page {slowest['page']} at {slowest['seconds']:.2f}s)")
 
-    def _process_pdf(self, file_path: str) -> str:
-        """Extract text from PDF files."""
-        text = ""
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            for page in pdf_reader.pages:
-                page_text = page.extract_text()
-                if page_text.strip():  # Only add non-empty pages
-                    text += page_text + "\n\n"
-        return text
-
-    def _process_docx(self, file_path: str) -> str:
+    def _iter_docx_blocks(self, file_path: str, progress: Optional[Callable[..., None]] = None) -> Iterator[Dict[str, Any]]:
         """Extract text from DOCX files."""
         doc = Document(file_path)
-        paragraphs = []
         for paragraph in doc.paragraphs:
             if paragraph.text.strip():  # Only add non-empty paragraphs
-                paragraphs.append(paragraph.text)
-        return "\n\n".join(paragraphs)
-
-    def _process_excel(self, file_path: str) -> str:
-        """Extract text from Excel files."""
-        df = pd.read_excel(file_path)
-        # Convert DataFrame to a more readable format
-        text_parts = []
-        
-        # Add column names
-        text_parts.append("Columns: " + ", ".join(df.columns))
-        
-        # Add data rows
-        for index, row in df.iterrows():
-            row_text = f"Row {index + 1}: " + ", ".join(str(val) for val in row)
-            text_parts.append(row_text)
-        
-        return "\n".join(text_parts)
+                yield {"text": paragraph.text, "page": None}
+
+    def _iter_excel_blocks(self, file_path: str, progress: Optional[Callable[..., None]] = None) -> Iterator[Dict[str, Any]]:
+        """Extract text from every sheet of an Excel file as self-describing row groups."""
+        start_time = time.time()
+        rows_parsed = 0
+        sheets = set()
+        for sheet_name, df in self._iter_sheet_frames(file_path):
+            yield from self._render_row_groups(sheet_name, df)
+            rows_parsed += len(df)
+            sheets.add(sheet_name)
+            if progress:
+                progress(rows_parsed=rows_parsed, sheets_parsed=len(sheets))
+
+        processing_time = time.time() - start_time
+        print(f"Excel extraction took {processing_time:.2f} seconds for {rows_parsed} rows in {len(sheets)} sheets")
+
+    def _iter_sheet_frames(self, file_path: str) -> Iterator[Tuple[str, pd.DataFrame]]:
+        """Yield (sheet name, DataFrame) pieces of every sheet, EXCEL_READ_ROWS rows at a time.
+
+        Frames are indexed by data row position (0 for the first row under the header).
+        """
+        read_rows = config.EXCEL_READ_ROWS
+        if file_path.lower().endswith('.xlsx') and config.EXCEL_STREAMING:
+            # Read-only openpyxl streams rows instead of loading the whole workbook
+            workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+            try:
+                for sheet in workbook.worksheets:
+                    rows = sheet.iter_rows(values_only=True)
+                    header = next(rows, None)
+                    if header is None:
+                        continue
+                    columns = [str(name) if name is not None else f"Unnamed: {i}" for i, name in enumerate(header)]
+                    width = len(columns)
+                    offset = 0
+                    batch = []
+                    for row in rows:
+                        # Read-only rows can be shorter or longer than the header
+                        batch.append(tuple(row[:width]) + (None,) * (width - len(row)))
+                        if len(batch) >= read_rows:
+                            index = pd.RangeIndex(offset, offset + len(batch))
+                            yield sheet.title, pd.DataFrame(batch, columns=columns, index=index).dropna(how='all')
+                            offset += len(batch)
+                            batch = []
+                    if batch:
+                        index = pd.RangeIndex(offset, offset + len(batch))
+                        yield sheet.title, pd.DataFrame(batch, columns=columns, index=index).dropna(how='all')
+            finally:
+                workbook.close()
+        else:
+            sheets = pd.read_excel(file_path, sheet_name=None, engine=config.EXCEL_ENGINE or None)
+            for sheet_name, df in sheets.items():
+                df = df.dropna(how='all')
+                for start in range(0, len(df), read_rows):
+                    yield str(sheet_name), df.iloc[start:start + read_rows]
+
+    @staticmethod
+    def _sheet_header(sheet_name: str, columns: Iterable[Any], max_chars: int) -> str:
+        """"Sheet: <name>. Columns: a, b, ..." listing as many columns as fit in max_chars."""
+        header = f"Sheet: {sheet_name}. Columns: "
+        columns = [str(column) for column in columns]
+        listed = []
+        length = len(header)
+        for position, column in enumerate(columns):
+            more = len(columns) - position - 1
+            # Keep room to say how many columns were left out
+            suffix = len(f" (+{more} more)") if more else 0
+            if length + len(column) + 2 + suffix > max_chars and listed:
+                break
+            listed.append(column)
+            length += len(column) + 2
+        header += ", ".join(listed)
+        if len(listed) < len(columns):
+            header += f" (+{len(columns) - len(listed)} more)"
+        return header[:max_chars]
+
+    def _render_row_groups(self, sheet_name: str, df: pd.DataFrame) -> Iterator[Dict[str, Any]]:
+        """Render rows with vectorized string ops and group them into chunk-sized blocks.
 
-    def _process_text(self, file_path: str) -> str:
-        """Extract text from plain text files."""
+        Every block repeats the sheet name and column header so it still makes sense
+        on its own once it has been embedded.
+        """
+        if df.empty:
+            return
+        # The header is repeated in every group, so it may take at most a third of the
+        # chunk; the rest is left for the rows, which would otherwise be truncated out
+        # of the embedding
+        header = self._sheet_header(sheet_name, df.columns, config.EXCEL_CHUNK_CHARS // 3)
+
+        # Column-wise concatenation instead of a Python loop over rows
+        values = df.astype(object).where(df.notna(), "").astype(str)
+        row_labels = pd.Series(df.index + 1, index=df.index).astype(str)
+        joined = values.iloc[:, 0].str.cat([values.iloc[:, i] for i in range(1, values.shape[1])], sep=", ")
+        rendered = "Row " + row_labels + ": " + joined
+
+        # Assign rows to groups so each group's text stays within the chunk budget
+        budget = max(config.EXCEL_CHUNK_CHARS - len(header), 1)
+        lengths = (rendered.str.len() + 1).to_numpy()
+        groups = (lengths.cumsum() - lengths) // budget
+
+        lines = rendered.to_numpy()
+        boundaries = np.flatnonzero(np.diff(groups)) + 1
+        for group in np.split(lines, boundaries):
+            yield {"text": header + "\n" + "\n".join(group), "page": None, "standalone": True}
+
+    def _iter_text_blocks(self, file_path: str, progress: Optional[Callable[..., None]] = None) -> Iterator[Dict[str, Any]]:
+        """Extract text from plain text files, one paragraph at a time."""
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                content = file.read()
-                # Ensure proper paragraph separation
-                return re.sub(r'\n\s*\n', '\n\n', content)
+            yield from self._read_paragraphs(file_path, 'utf-8')
         except UnicodeDecodeError:
             # Try with a different encoding if UTF-8 fails
-            with open(file_path, 'r', encoding='latin-1') as file:
-                content = file.read()
-                return re.sub(r'\n\s*\n', '\n\n', content)
+            yield from self._read_paragraphs(file_path, 'latin-1')
 
-    def _process_image(self, file_path: str) -> str:
+    def _read_paragraphs(self, file_path: str, encoding: str) -> Iterator[Dict[str, Any]]:
+        """Read a text file line by line, yielding blank-line separated paragraphs."""
+        # Decode everything first so a late decoding error can't follow already yielded blocks
+        with open(file_path, 'r', encoding=encoding) as file:
+            for _ in file:
+                pass
+        
+        with open(file_path, 'r', encoding=encoding) as file:
+            lines = []
+            for line in file:
+                if line.strip():
+                    lines.append(line)
+                elif lines:
+                    yield {"text": "".join(lines), "page": None}
+                    lines = []
+            if lines:
+                yield {"text": "".join(lines), "page": None}
+
+    def _iter_image_blocks(self, file_path: str, progress: Optional[Callable[..., None]] = None) -> Iterator[Dict[str, Any]]:
         """Extract text from images using OCR."""
         try:
             image = Image.open(file_path)
@@ -124,15 +278,24 @@ class DocumentProcessor:
             if image.mode != 'L':
                 image = image.convert('L')
             text = pytesseract.image_to_string(image)
-            return text
         except Exception as e:
             print(f"Error processing image: {e}")
-            return ""
+            return
+        yield from self._split_paragraphs(text)
+
+    def _file_hash(self, file_path: str) -> str:
+        """SHA-256 of the file contents, used to recognise re-uploads."""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as file:
+            for block in iter(lambda: file.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
 
     def _extract_metadata(self, file_path: str) -> Dict[str, Any]:
         """Extract metadata from the file."""
         stats = os.stat(file_path)
         return {
+            "file_hash": self._file_hash(file_path),
             "size": stats.st_size,
             "created": datetime.fromtimestamp(stats.st_ctime).isoformat(),
             "modified": datetime.fromtimestamp(stats.st_mtime).isoformat(),
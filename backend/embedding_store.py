@@ -0,0 +1,157 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class EmbeddingStore:
+    """SQLite-backed cache of chunk embeddings and of already ingested files.
+
+    Embeddings are keyed by (model name, content hash) so re-uploading the same or
+    a lightly edited document only encodes the chunks that actually changed. The
+    store also keeps a log of stored and deleted documents, so server processes
+    sharing it can tell when another one changed the corpus.
+    """
+
+    # Changes kept in the log; a process further behind than this refreshes everything
+    CHANGE_LOG_SIZE = 10000
+
+    def __init__(self, path: str = "vector_storage/embeddings.sqlite3"):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, content_hash)
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                file_hash TEXT PRIMARY KEY,
+                doc_id TEXT NOT NULL,
+                filename TEXT,
+                created REAL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                doc_id TEXT NOT NULL,
+                pid INTEGER NOT NULL,
+                created REAL
+            )
+        """)
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def content_hash(text: str) -> str:
+        """Stable digest of a chunk's text."""
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, np.ndarray]:
+        """Look up stored embeddings, returning only the hashes that were found."""
+        found = {}
+        with self._lock:
+            # Stay well under SQLite's limit on bound parameters
+            for i in range(0, len(hashes), 500):
+                group = hashes[i:i + 500]
+                placeholders = ",".join("?" * len(group))
+                rows = self._conn.execute(
+                    f"SELECT content_hash, vector FROM embeddings WHERE model = ? AND content_hash IN ({placeholders})",
+                    [model, *group]
+                ).fetchall()
+                for content_hash, vector in rows:
+                    found[content_hash] = np.frombuffer(vector, dtype=np.float32)
+            self.hits += len(found)
+            self.misses += len(hashes) - len(found)
+        return found
+
+    def put_many(self, model: str, embeddings: Dict[str, np.ndarray]):
+        """Store embeddings keyed by content hash."""
+        rows = [
+            (model, content_hash, int(vector.shape[0]), np.asarray(vector, dtype=np.float32).tobytes())
+            for content_hash, vector in embeddings.items()
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, content_hash, dim, vector) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def get_document(self, file_hash: str) -> Optional[str]:
+        """Return the doc_id a file with this hash was stored under, if any."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT doc_id FROM documents WHERE file_hash = ?", (file_hash,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put_document(self, file_hash: str, doc_id: str, filename: str):
+        """Remember which doc_id a file was stored under."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (file_hash, doc_id, filename, created) VALUES (?, ?, ?, ?)",
+                (file_hash, doc_id, filename, time.time())
+            )
+            self._conn.commit()
+
+    def delete_document(self, doc_id: str):
+        """Forget a deleted document so the same file can be ingested again."""
+        with self._lock:
+            self._conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+            self._conn.commit()
+
+    def record_change(self, doc_id: str):
+        """Log that a document was stored or deleted by this process."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO changes (doc_id, pid, created) VALUES (?, ?, ?)",
+                (doc_id, os.getpid(), time.time())
+            )
+            self._conn.execute("DELETE FROM changes WHERE seq <= ?", (cursor.lastrowid - self.CHANGE_LOG_SIZE,))
+            self._conn.commit()
+
+    def changes_since(self, seq: int) -> Tuple[int, Optional[List[str]]]:
+        """The latest change's number and the documents other processes changed after seq.
+
+        The documents are None if the log no longer reaches back to seq.
+        """
+        with self._lock:
+            latest, oldest = self._conn.execute("SELECT MAX(seq), MIN(seq) FROM changes").fetchone()
+            if latest is None or latest <= seq:
+                return seq, []
+            if oldest > seq + 1:
+                return latest, None
+            rows = self._conn.execute(
+                "SELECT DISTINCT doc_id FROM changes WHERE seq > ? AND seq <= ? AND pid != ?",
+                (seq, latest, os.getpid())
+            ).fetchall()
+        return latest, [row[0] for row in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        """Lookup counters and store size."""
+        with self._lock:
+            embeddings = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            documents = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "embeddings": embeddings,
+                "documents": documents,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
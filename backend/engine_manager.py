@@ -0,0 +1,120 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+
+class EngineUnavailableError(Exception):
+    """Raised when an engine is disabled or failed to load."""
+
+    def __init__(self, name: str, reason: str):
+        super().__init__(f"{name} engine is {reason}")
+        self.name = name
+        self.reason = reason
+
+
+class _Engine:
+    def __init__(self, factory: Callable[[], Any], enabled: bool):
+        self.factory = factory
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.instance = None
+        self.state = "not_loaded" if enabled else "disabled"
+        self.load_seconds = None
+        self.error = None
+
+
+class EngineManager:
+    """Create engines on first use, or ahead of time on a background thread.
+
+    Factories should import their engine's module themselves, so that neither the
+    model weights nor the heavy libraries behind a disabled or not yet used engine
+    are loaded. Each engine is created at most once; concurrent callers wait for
+    the one doing the loading. A failed load is retried on the next use.
+    """
+
+    def __init__(self, factories: Dict[str, Callable[[], Any]], enabled: Iterable[str],
+                 preloaders: Optional[Dict[str, Callable[[], Any]]] = None):
+        enabled = set(enabled)
+        unknown = enabled - set(factories)
+        if unknown:
+            raise ValueError(f"Unknown engines: {', '.join(sorted(unknown))}")
+        self._engines = {name: _Engine(factory, name in enabled) for name, factory in factories.items()}
+        self._preloaders = preloaders or {}
+        self._warmup = set()
+
+    def preload(self, names: Iterable[str]):
+        """Load the weights of the given enabled engines without creating the engines.
+
+        Meant for a parent process about to fork workers: the weights are shared,
+        while each worker still creates its own engines (threads, database
+        connections) after the fork.
+        """
+        for name in names:
+            if self._engines[name].enabled and name in self._preloaders:
+                start_time = time.time()
+                self._preloaders[name]()
+                print(f"{name} engine weights preloaded in {time.time() - start_time:.2f} seconds")
+
+    def get(self, name: str) -> Any:
+        """Return the engine, loading it first if needed (blocking)."""
+        engine = self._engines[name]
+        if engine.instance is not None:
+            return engine.instance
+        if not engine.enabled:
+            raise EngineUnavailableError(name, "disabled")
+
+        with engine.lock:
+            if engine.instance is None:
+                engine.state = "loading"
+                start_time = time.time()
+                try:
+                    instance = engine.factory()
+                except Exception as e:
+                    engine.state = "failed"
+                    engine.error = str(e)
+                    print(f"Loading the {name} engine failed: {e}")
+                    raise EngineUnavailableError(name, f"unavailable ({e})")
+                engine.load_seconds = time.time() - start_time
+                engine.error = None
+                engine.instance = instance
+                engine.state = "ready"
+                print(f"{name} engine loaded in {engine.load_seconds:.2f} seconds")
+        return engine.instance
+
+    def peek(self, name: str) -> Optional[Any]:
+        """The engine if it is already loaded, without loading it."""
+        return self._engines[name].instance
+
+    def is_enabled(self, name: str) -> bool:
+        return self._engines[name].enabled
+
+    def warm_up(self, names: Iterable[str]) -> threading.Thread:
+        """Load the given enabled engines one after another on a background thread."""
+        names = [name for name in names if self._engines[name].enabled]
+        self._warmup.update(names)
+
+        def load_all():
+            for name in names:
+                try:
+                    self.get(name)
+                except EngineUnavailableError:
+                    pass
+
+        thread = threading.Thread(target=load_all, name="engine-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def ready(self) -> bool:
+        """True once every engine being warmed up has loaded; lazy engines don't count."""
+        return all(self._engines[name].state == "ready" for name in self._warmup)
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {
+                "state": engine.state,
+                "load_seconds": round(engine.load_seconds, 3) if engine.load_seconds is not None else None,
+                "warm_up": name in self._warmup,
+                "error": engine.error,
+            }
+            for name, engine in self._engines.items()
+        }
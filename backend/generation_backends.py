@@ -0,0 +1,76 @@
+import os
+import time
+from typing import Any, Tuple
+
+import torch
+from transformers import AutoModelForSeq2SeqLM
+
+BACKENDS = ("pytorch", "int8", "onnx", "compile")
+
+
+def _load_pytorch(model_name: str, device: str):
+    model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+    model.to(device)
+    model.eval()  # Set to evaluation mode
+    if device == "cuda":
+        model = model.half()  # Use FP16 for faster inference
+    return model
+
+
+def _load_int8(model_name: str):
+    """Dynamic int8 quantization of the Linear layers; weights are quantized once, activations per call."""
+    model = _load_pytorch(model_name, "cpu")
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _load_onnx(model_name: str, device: str, export_dir: str):
+    """ONNX Runtime encoder/decoder export, with a decoder that reuses past key/values."""
+    try:
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    except ImportError:
+        raise RuntimeError("The onnx generation backend needs optimum[onnxruntime]")
+
+    provider = "CUDAExecutionProvider" if device == "cuda" else "CPUExecutionProvider"
+    model_dir = os.path.join(export_dir, model_name.replace("/", "--"))
+    if os.path.isdir(model_dir):
+        return ORTModelForSeq2SeqLM.from_pretrained(model_dir, use_cache=True, provider=provider)
+
+    # Export once and keep the ONNX graphs for the next start
+    model = ORTModelForSeq2SeqLM.from_pretrained(model_name, export=True, use_cache=True, provider=provider)
+    model.save_pretrained(model_dir)
+    return model
+
+
+def _load_compiled(model_name: str, device: str):
+    """torch.compile the forward pass that generate() calls once per decoding step."""
+    model = _load_pytorch(model_name, device)
+    # Shapes change every step (growing KV cache, batch sizes), so compile dynamically
+    model.forward = torch.compile(model.forward, dynamic=True)
+    return model
+
+
+def load_generation_model(model_name: str, backend: str = "pytorch", device: str = "cpu",
+                          export_dir: str = "model_cache/onnx") -> Tuple[Any, str]:
+    """Load a seq2seq model for generation with the given backend.
+
+    Every backend returns a model with the transformers generate() API, so the
+    rest of NLEngine doesn't care which one is in use. KV caching (use_cache) is
+    on for all of them. Returns (model, device actually used).
+    """
+    start_time = time.time()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unsupported generation backend: {backend}")
+
+    if backend == "pytorch":
+        model = _load_pytorch(model_name, device)
+    elif backend == "int8":
+        # Quantized kernels are CPU only
+        device = "cpu"
+        model = _load_int8(model_name)
+    elif backend == "onnx":
+        model = _load_onnx(model_name, device, export_dir)
+    else:
+        model = _load_compiled(model_name, device)
+
+    print(f"Generation model loaded with the {backend} backend in {time.time() - start_time:.2f} seconds")
+    return model, device
@@ -0,0 +1,49 @@
+import gc
+import os
+import sys
+
+import config
+
+# Run with: gunicorn -c gunicorn.conf.py main:app
+#
+# The app is imported and the model weights loaded once, in the parent process,
+# before the workers are forked. The workers then share the weights' memory pages
+# copy-on-write instead of each loading its own copy, as `uvicorn --workers` would.
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = config.WEB_WORKERS
+
+# Embedded Chroma clients each keep (and persist) their own copy of the indexes, so
+# workers writing to the same directory would overwrite each other's vectors
+if workers > 1 and config.VECTOR_BACKEND != "http":
+    raise RuntimeError(
+        f"WEB_WORKERS={workers} needs VECTOR_BACKEND=http and a Chroma server "
+        f"(VECTOR_BACKEND is {config.VECTOR_BACKEND!r}); see README, Running multiple workers"
+    )
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+# Workers load their engines (not the weights) at startup, and long answers are streamed
+timeout = 300
+graceful_timeout = 30
+
+# Fast tokenizers start a thread pool on first use, which doesn't survive a fork
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+
+def when_ready(server):
+    """Load the enabled engines' weights in the parent, before the workers are forked."""
+    import main
+
+    main.engines.preload(config.ENABLED_ENGINES)
+    # Move everything loaded so far out of the garbage collector's reach, so that
+    # collections in the workers don't write to (and so copy) the shared pages
+    gc.freeze()
+    server.log.info(f"Models preloaded, starting {workers} workers")
+
+
+def post_fork(server, worker):
+    # Split the CPU cores between the workers instead of each one using all of them
+    if "torch" in sys.modules:
+        import torch
+
+        torch.set_num_threads(config.CPU_THREADS)
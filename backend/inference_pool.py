@@ -0,0 +1,167 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Optional, Tuple
+
+
+# Marks the end of a generator relayed by InferencePool.stream
+_END = object()
+
+
+class StageBusyError(Exception):
+    """Raised when a stage already has as many jobs as it is allowed to queue."""
+
+    def __init__(self, stage: str, retry_after: int):
+        super().__init__(f"Inference stage '{stage}' is at capacity")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class _Stage:
+    def __init__(self, name: str, workers: int, queue_size: int):
+        self.name = name
+        self.workers = workers
+        self.queue_size = queue_size
+        # Threads are spawned lazily on the first submit
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{name}-worker")
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.busy_time = 0.0
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.queue_size
+
+
+class InferencePool:
+    """Bounded thread pools that keep blocking model calls off the event loop.
+
+    Each stage (ingestion, parsing, embedding, generation, streaming, tts, stt) gets its own executor so a
+    long generation can't starve uploads, and a cap on running + queued jobs so we
+    shed load with a 429 instead of building an unbounded backlog.
+    """
+
+    def __init__(self, stages: Dict[str, Tuple[int, int]], retry_after: int = 5):
+        self.retry_after = retry_after
+        self._stages = {
+            name: _Stage(name, workers, queue_size)
+            for name, (workers, queue_size) in stages.items()
+        }
+
+    def submit(self, stage: str, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """Schedule fn on the given stage, raising StageBusyError if its queue is full."""
+        state = self._stages[stage]
+        with state.lock:
+            if state.pending >= state.capacity:
+                state.rejected += 1
+                raise StageBusyError(stage, self.retry_after)
+            state.pending += 1
+
+        def timed_call():
+            start_time = time.time()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with state.lock:
+                    state.busy_time += time.time() - start_time
+
+        def on_done(future: Future):
+            with state.lock:
+                state.pending -= 1
+                if future.exception() is None:
+                    state.completed += 1
+                else:
+                    state.failed += 1
+
+        try:
+            future = state.executor.submit(timed_call)
+        except Exception:
+            with state.lock:
+                state.pending -= 1
+            raise
+        future.add_done_callback(on_done)
+        return future
+
+    async def run(self, stage: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run fn on the given stage and await its result."""
+        return await asyncio.wrap_future(self.submit(stage, fn, *args, **kwargs))
+
+    def stream(self, stage: str, gen_fn: Callable[..., Iterable[Any]], *args, **kwargs) -> AsyncIterator[Any]:
+        """Run a blocking generator on the given stage and relay its items to async code.
+
+        Each item is produced by a job of its own, so the worker is free again
+        while the item is on its way to the client and a slow or stalled reader
+        can't keep other requests off the stage. The next item is produced while
+        the current one is consumed. The first job is scheduled immediately, so
+        StageBusyError is raised here rather than on first iteration; later jobs
+        wait for room on the stage instead. The generator is closed early if the
+        consumer goes away (e.g. the client disconnects).
+        """
+        state = {}
+
+        def step():
+            # Steps run one after another, never concurrently
+            if "iterator" not in state:
+                state["iterator"] = iter(gen_fn(*args, **kwargs))
+            return next(state["iterator"], _END)
+
+        return self._relay(stage, step, self.submit(stage, step), state)
+
+    async def _relay(self, stage: str, step: Callable[[], Any], future: Future,
+                     state: Dict[str, Any]) -> AsyncIterator[Any]:
+        try:
+            while True:
+                item = await asyncio.wrap_future(future)
+                if item is _END:
+                    break
+                future = await self._submit_when_free(stage, step)
+                yield item
+        finally:
+            def close(_: Optional[Future] = None):
+                close_iterator = getattr(state.get("iterator"), "close", None)
+                if close_iterator:
+                    close_iterator()
+
+            # A generator can't be closed while a step is running it
+            if future.done():
+                close()
+            else:
+                future.add_done_callback(close)
+
+    async def _submit_when_free(self, stage: str, fn: Callable[[], Any]) -> Future:
+        while True:
+            try:
+                return self.submit(stage, fn)
+            except StageBusyError:
+                await asyncio.sleep(0.05)
+
+    def load(self, stage: str) -> float:
+        """Fraction of the stage's capacity currently in use."""
+        state = self._stages[stage]
+        with state.lock:
+            return state.pending / state.capacity
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-stage counters for monitoring and tuning."""
+        stats = {}
+        for name, state in self._stages.items():
+            with state.lock:
+                stats[name] = {
+                    "workers": state.workers,
+                    "queue_size": state.queue_size,
+                    "pending": state.pending,
+                    "completed": state.completed,
+                    "failed": state.failed,
+                    "rejected": state.rejected,
+                    "busy_seconds": round(state.busy_time, 3),
+                }
+        return stats
+
+    def shutdown(self, wait: bool = True):
+        """Stop all stage executors."""
+        for state in self._stages.values():
+            state.executor.shutdown(wait=wait)
@@ -0,0 +1,228 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # No cross-process job claiming on Windows, run a single server process there
+    fcntl = None
+
+
+class JobQueue:
+    """Background queue for document ingestion jobs.
+
+    Job state is written to one JSON file per job, so jobs that were queued or
+    running when the server stopped are picked up again on the next start.
+
+    Several server processes can share the directory: a process runs a job only
+    after claiming it with an exclusive lock on its "<id>.lock" file, which the
+    OS releases if the process dies, and jobs run elsewhere are read from disk.
+    """
+
+    FINISHED = ("completed", "failed")
+
+    def __init__(self, directory: str = "jobs", workers: int = 2, persist_interval: float = 0.5,
+                 retention_seconds: float = 7 * 24 * 3600):
+        self.directory = directory
+        self.workers = workers
+        self.retention_seconds = retention_seconds
+        self.persist_interval = persist_interval
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._last_persisted: Dict[str, float] = {}
+        # Lock files of the jobs this process has claimed
+        self._claims: Dict[str, Any] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+        os.makedirs(directory, exist_ok=True)
+        self._load_existing()
+
+    def _job_path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _load_existing(self):
+        """Reload job state, dropping finished jobs past their retention period."""
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, "r", encoding="utf-8") as file:
+                    job = json.load(file)
+                if job["status"] in self.FINISHED and now - job["updated"] > self.retention_seconds:
+                    os.remove(path)
+                    if os.path.exists(self._lock_path(job["id"])):
+                        os.remove(self._lock_path(job["id"]))
+                    continue
+                self._jobs[job["id"]] = job
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Skipping unreadable job file {name}: {e}")
+
+    def _lock_path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.lock")
+
+    def _read(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """A job's state as last written to disk, by any process."""
+        try:
+            with open(self._job_path(job_id), "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def _claim(self, job_id: str) -> bool:
+        """Take a job for this process; False if another process holds it."""
+        if fcntl is None:
+            return True
+        with self._lock:
+            if job_id in self._claims:
+                return True
+        lock_file = open(self._lock_path(job_id), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        with self._lock:
+            self._claims[job_id] = lock_file
+        return True
+
+    def _release(self, job_id: str):
+        with self._lock:
+            lock_file = self._claims.pop(job_id, None)
+        if lock_file is not None:
+            lock_file.close()
+
+    def _persist(self, job: Dict[str, Any]):
+        """Write a job's state atomically."""
+        path = self._job_path(job["id"])
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(job, file)
+        os.replace(temp_path, path)
+        self._last_persisted[job["id"]] = time.time()
+
+    def create(self, file_path: str, filename: str) -> Dict[str, Any]:
+        """Register a new job for an uploaded file and queue it."""
+        now = time.time()
+        job = {
+            "id": str(uuid.uuid4()),
+            "file_path": file_path,
+            "filename": filename,
+            "status": "queued",
+            "stage": None,
+            "progress": {},
+            "document_id": None,
+            "error": None,
+            "created": now,
+            "updated": now,
+        }
+        with self._lock:
+            self._jobs[job["id"]] = job
+            self._persist(job)
+        self._claim(job["id"])
+        if self._queue is not None:
+            self._queue.put_nowait(job["id"])
+        return dict(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Snapshot of a job's state."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            local = job is not None and (job_id in self._claims or job["status"] in self.FINISHED)
+            if local:
+                return json.loads(json.dumps(job))
+
+        # Created or being run by another server process
+        job = self._read(job_id)
+        if job is not None:
+            with self._lock:
+                if job_id not in self._claims:
+                    self._jobs[job_id] = job
+        return job
+
+    def update(self, job_id: str, **fields):
+        """Change a job's status or result fields."""
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(fields)
+            job["updated"] = time.time()
+            self._persist(job)
+
+    def report_progress(self, job_id: str, **counters):
+        """Record progress counters; safe to call from worker threads."""
+        with self._lock:
+            job = self._jobs[job_id]
+            job["progress"].update(counters)
+            job["updated"] = time.time()
+            # Progress can be reported per page or chunk, so don't hit the disk every time
+            if time.time() - self._last_persisted.get(job_id, 0) >= self.persist_interval:
+                self._persist(job)
+
+    async def start(self, handler: Callable[[Dict[str, Any]], Awaitable[Optional[str]]]):
+        """Start the workers and requeue jobs left unfinished by a previous run."""
+        self._queue = asyncio.Queue()
+        with self._lock:
+            pending = sorted(
+                (job for job in self._jobs.values() if job["status"] not in self.FINISHED),
+                key=lambda job: job["created"]
+            )
+        for job in pending:
+            # Another server process may be running it, or may have finished it meanwhile
+            if not self._claim(job["id"]):
+                continue
+            job = self._read(job["id"]) or job
+            with self._lock:
+                self._jobs[job["id"]] = job
+            if job["status"] in self.FINISHED:
+                self._release(job["id"])
+                continue
+            if job["status"] != "queued":
+                print(f"Resuming interrupted job {job['id']} ({job['filename']})")
+                self.update(job["id"], status="queued", stage=None, progress={})
+            self._queue.put_nowait(job["id"])
+
+        self._tasks = [asyncio.create_task(self._worker(handler)) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Cancel the workers; unfinished jobs are resumed on the next start."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self, handler: Callable[[Dict[str, Any]], Awaitable[Optional[str]]]):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                job = self.get(job_id)
+                if job is None or job["status"] in self.FINISHED:
+                    continue
+                start_time = time.time()
+                document_id = await handler(job)
+                self.update(job_id, status="completed", document_id=document_id)
+                print(f"Job {job_id} completed in {time.time() - start_time:.2f} seconds")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Job {job_id} failed: {e}")
+                self.update(job_id, status="failed", error=str(e))
+            finally:
+                self._release(job_id)
+                self._queue.task_done()
+
+    def stats(self) -> Dict[str, int]:
+        """Number of jobs per status."""
+        with self._lock:
+            job_ids = list(self._jobs)
+        counts = {}
+        for job_id in job_ids:
+            job = self.get(job_id)
+            if job is not None:
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return counts
@@ -1,13 +1,27 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Query as QueryParam, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+from concurrent.futures import Future
+from urllib.parse import quote
 import uvicorn
+import asyncio
+import functools
+import io
+import json
 import os
+import shutil
+import time
+import uuid
+import config
+from answer_cache import AnswerCache
+from engine_manager import EngineManager, EngineUnavailableError
+import model_registry
+from inference_pool import InferencePool, StageBusyError
+from job_queue import JobQueue
+from table_engine import TableQueryEngine
 from document_processor import DocumentProcessor
-from vector_engine import VectorEngine
-from nlp_engine import NLEngine
-from voice_engine import VoiceEngine
 
 app = FastAPI(title="Document Analysis Agent")
 
@@ -18,6 +32,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Stage timings and the recognized question of /voice-query
+    expose_headers=["Server-Timing", "X-Transcript", "X-Profile", "X-Sample-Rate"],
 )
 
 # Ensure required directories exist
@@ -26,105 +42,569 @@ os.makedirs("audio_output", exist_ok=True)
 os.makedirs("vector_storage", exist_ok=True)
 os.makedirs("model_cache", exist_ok=True)
 
-# Initialize components
+# Initialize components. The model-backed engines are created on first use (or warmed
+# up in the background after startup) and import their libraries only then.
 doc_processor = DocumentProcessor()
-vector_engine = VectorEngine()
-nl_engine = NLEngine()
-voice_engine = VoiceEngine()
+table_engine = TableQueryEngine(doc_processor.table_store)
+
+def load_vector_engine():
+    from vector_engine import VectorEngine
+    vector_engine = VectorEngine()
+    # Answers about documents another worker stored or deleted are stale here too
+    if answer_cache is not None:
+        vector_engine.on_documents_changed(answer_cache.invalidate)
+    return vector_engine
+
+def load_nlp_engine():
+    from nlp_engine import NLEngine
+    return NLEngine()
+
+def load_voice_engine():
+    from voice_engine import VoiceEngine
+    return VoiceEngine()
+
+# Weights only, loaded into the shared model registry (see gunicorn.conf.py)
+def preload_vector_models():
+    from vector_engine import VectorEngine
+    VectorEngine.load_models()
+
+def preload_nlp_models():
+    from nlp_engine import NLEngine
+    NLEngine.load_models()
+
+def preload_voice_models():
+    from voice_engine import VoiceEngine
+    VoiceEngine.load_models()
+
+engines = EngineManager({
+    "vector": load_vector_engine,
+    "nlp": load_nlp_engine,
+    "voice": load_voice_engine,
+}, enabled=config.ENABLED_ENGINES, preloaders={
+    "vector": preload_vector_models,
+    "nlp": preload_nlp_models,
+    "voice": preload_voice_models,
+})
+
+async def get_engine(name: str):
+    """Return an engine, loading it off the event loop on first use; 503 if it is unavailable."""
+    engine = engines.peek(name)
+    if engine is not None:
+        return engine
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(None, engines.get, name)
+    except EngineUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+# Answers to earlier questions, reused for near-identical ones about the same documents
+answer_cache = AnswerCache(
+    max_entries=config.ANSWER_CACHE_SIZE,
+    ttl_seconds=config.ANSWER_CACHE_TTL_SECONDS,
+    threshold=config.ANSWER_CACHE_THRESHOLD
+) if config.ANSWER_CACHE_ENABLED else None
+
+# Bounded worker pools for blocking model calls, one per pipeline stage. Background
+# ingestion (parsing, OCR and indexing) has its own stage, one slot per job worker,
+# so long uploads can't fill the pools that queries need. Streamed answers can't be
+# batched, so they run on a small stage of their own instead of next to the batcher.
+inference_pool = InferencePool({
+    "ingestion": (config.INGEST_WORKERS, 0),
+    "parsing": (config.PARSING_WORKERS, config.PARSING_QUEUE_SIZE),
+    "embedding": (config.EMBEDDING_WORKERS, config.EMBEDDING_QUEUE_SIZE),
+    "generation": (config.GENERATION_WORKERS, config.GENERATION_QUEUE_SIZE),
+    "streaming": (config.STREAMING_WORKERS, config.STREAMING_QUEUE_SIZE),
+    "tts": (config.TTS_WORKERS, config.TTS_QUEUE_SIZE),
+    "stt": (config.STT_WORKERS, config.STT_QUEUE_SIZE),
+}, retry_after=config.RETRY_AFTER_SECONDS)
+
+def stage_busy(e: StageBusyError) -> HTTPException:
+    """429 response telling the client when to retry a saturated stage."""
+    return HTTPException(
+        status_code=429,
+        detail=f"Server busy ({e.stage}), please retry later",
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+async def run_stage(stage: str, fn, *args, **kwargs):
+    """Run a blocking engine call on its stage pool, answering 429 when the stage is saturated."""
+    try:
+        return await inference_pool.run(stage, fn, *args, **kwargs)
+    except StageBusyError as e:
+        raise stage_busy(e)
+
+def stream_generation(nl_engine, text: str, context: List[Dict[str, Any]],
+                      profile: str) -> Tuple[AsyncIterator[str], Future]:
+    """Start a streamed answer on the streaming stage, raising StageBusyError if it is full.
+
+    Returns the answer's text pieces and a future of the final response. The
+    generating worker pushes the pieces to the event loop itself, so no other
+    thread waits on them.
+    """
+    loop = asyncio.get_running_loop()
+    pieces = asyncio.Queue()
+
+    def push(piece: Optional[str]):
+        try:
+            loop.call_soon_threadsafe(pieces.put_nowait, piece)
+        except RuntimeError:
+            # Event loop already closed
+            pass
+
+    generate = nl_engine.stream_response(text, context, push, profile)
+    generation = inference_pool.submit("streaming", generate)
+    generation.add_done_callback(lambda _: push(None))
+
+    async def relay() -> AsyncIterator[str]:
+        while True:
+            try:
+                piece = await asyncio.wait_for(pieces.get(), config.STREAM_TOKEN_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"No token generated for {config.STREAM_TOKEN_TIMEOUT_SECONDS:.0f} seconds")
+            if piece is None:
+                return
+            yield piece
+
+    return relay(), generation
+
+async def synthesize(text: str) -> Optional[str]:
+    """Speak a response on the tts stage; None when speech is disabled."""
+    if not engines.is_enabled("voice"):
+        return None
+    voice_engine = await get_engine("voice")
+    return await run_stage("tts", voice_engine.text_to_speech, text)
+
+# Background ingestion of uploaded documents
+job_queue = JobQueue("jobs", workers=config.INGEST_WORKERS)
+
+async def run_job_stage(stage: str, fn, *args, **kwargs):
+    """Run a pipeline stage for a background job or live stream, waiting for capacity instead of failing."""
+    while True:
+        try:
+            return await inference_pool.run(stage, fn, *args, **kwargs)
+        except StageBusyError as e:
+            await asyncio.sleep(e.retry_after)
+
+async def ingest_document(job: dict) -> str:
+    """Parse an uploaded file and index it, reporting progress on the job."""
+    job_id = job["id"]
+    progress = functools.partial(job_queue.report_progress, job_id)
+    
+    job_queue.update(job_id, status="processing", stage="parsing")
+    try:
+        document, blocks = await run_job_stage("ingestion", doc_processor.stream_document, job["file_path"], progress)
+    except Exception as e:
+        raise RuntimeError(f"Error processing document: {str(e)}")
+    
+    # Parsing continues on a background thread while chunks are embedded and stored;
+    # chunk embeddings go through the vector engine's batcher, not the embedding stage
+    job_queue.update(job_id, stage="embedding")
+    try:
+        vector_engine = await get_engine("vector")
+        doc_id = await run_job_stage("ingestion", vector_engine.store_document_stream, document, blocks, job["filename"], progress)
+    except Exception as e:
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        raise RuntimeError(f"Error ingesting document: {detail}")
+    
+    # Spreadsheets also get a columnar copy for aggregate questions. It is optional: the
+    # document is already indexed, and without it questions fall back to retrieval
+    if document["file_type"] in (".xlsx", ".xls"):
+        job_queue.update(job_id, stage="tables")
+        try:
+            await run_job_stage("ingestion", doc_processor.persist_tables, job["file_path"], doc_id)
+        except Exception as e:
+            print(f"Error storing spreadsheet tables for {doc_id}: {e}")
+    
+    # Corpus-wide answers may change with the new document
+    if answer_cache is not None:
+        answer_cache.invalidate(doc_id)
+    
+    return doc_id
+
+@app.on_event("startup")
+async def warm_up_engines():
+    # Load models in the background so the server answers (and /healthz works) right away
+    if config.ENGINE_WARMUP:
+        engines.warm_up(config.ENABLED_ENGINES)
+
+@app.on_event("startup")
+async def start_job_queue():
+    await job_queue.start(ingest_document)
+
+@app.on_event("shutdown")
+async def shutdown_workers():
+    await job_queue.stop()
+    inference_pool.shutdown(wait=False)
 
 class Query(BaseModel):
     text: str
     document_id: Optional[str] = None
+    # Several documents, or "all" to search the whole corpus
+    document_ids: Optional[Union[List[str], str]] = None
+    # "vector", "keyword" or "hybrid"; defaults to config.SEARCH_MODE
+    mode: Optional[str] = None
+    # Decoding profile (see NLEngine.PROFILES); picked from the server load if not given
+    profile: Optional[str] = None
 
-@app.post("/upload")
+SEARCH_MODES = ("vector", "keyword", "hybrid")
+
+def document_scope(query: Query) -> Union[str, List[str], None]:
+    """Documents a query searches: one id, a list of ids, or None for all documents."""
+    if query.document_ids == "all":
+        return None
+    if isinstance(query.document_ids, list):
+        ids = list(dict.fromkeys(query.document_ids + ([query.document_id] if query.document_id else [])))
+        if ids:
+            return ids if len(ids) > 1 else ids[0]
+    elif query.document_ids is not None:
+        raise HTTPException(status_code=400, detail='document_ids must be a list of document IDs or "all"')
+    if not query.document_id:
+        raise HTTPException(status_code=400, detail="No document ID provided")
+    return query.document_id
+
+@app.post("/upload", status_code=202)
 async def upload_document(file: UploadFile = File(...)):
     try:
         if not file.filename:
             raise HTTPException(status_code=400, detail="No file provided")
             
-        # Save the uploaded file
-        file_location = f"uploads/{file.filename}"
+        # Save the uploaded file in its own directory so same-named uploads can't collide
+        filename = os.path.basename(file.filename)
+        upload_dir = os.path.join("uploads", str(uuid.uuid4()))
+        file_location = os.path.join(upload_dir, filename)
         try:
+            os.makedirs(upload_dir, exist_ok=True)
             with open(file_location, "wb+") as file_object:
                 file_object.write(await file.read())
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error saving file: {str(e)}")
         
-        # Process the document
-        try:
-            doc_content = doc_processor.process_document(file_location)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Error processing document: {str(e)}")
+        # Parsing and indexing happen in the background, poll /jobs/{job_id} for progress
+        job = job_queue.create(file_location, filename)
         
-        # Store in vector database
-        try:
-            doc_id = vector_engine.store_document(doc_content, file.filename)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Error storing document in vector database: {str(e)}")
-        
-        return {"message": "Document processed successfully", "document_id": doc_id}
+        return {"message": "Document queued for processing", "job_id": job["id"], "status": job["status"]}
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    # Don't expose server paths; the job may be the queue's own record of another process's job
+    job = dict(job)
+    job.pop("file_path", None)
+    return job
+
+async def answer_from_table(query: Query, scope: Union[str, List[str], None]) -> Optional[dict]:
+    """Answer aggregate/filter questions about a spreadsheet directly from its table."""
+    # Aggregates are only computed over a single spreadsheet; checking for its tables
+    # is a stat call, cheap enough for the event loop and keeps other queries off the stage
+    if not isinstance(scope, str) or not doc_processor.table_store.has(scope):
+        return None
+    try:
+        return await run_stage("parsing", table_engine.answer, query.text, scope)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Table query failed, falling back to retrieval: {e}")
+        return None
+
+async def decoding_profile(query: Query, streaming: bool = False) -> str:
+    """The requested decoding profile, or one chosen from how busy generation is.
+
+    Streamed answers get the profile that actually decodes them, so that's the one
+    they report and are cached under.
+    """
+    nl_engine = await get_engine("nlp")
+    if query.profile:
+        if query.profile not in nl_engine.PROFILES:
+            raise HTTPException(status_code=400, detail=f"Unknown decoding profile: {query.profile}")
+        profile = query.profile
+    elif config.GENERATION_PROFILE != "auto":
+        profile = config.GENERATION_PROFILE
+    else:
+        # Trade answer quality for latency as the generation stage fills up
+        load = inference_pool.load("generation")
+        if load >= config.PROFILE_FAST_LOAD:
+            profile = "fast"
+        elif load >= config.PROFILE_BALANCED_LOAD:
+            profile = "balanced"
+        else:
+            profile = "quality"
+    return nl_engine.streaming_profile(profile) if streaming else profile
+
+def answer_scope(query: Query, scope: Union[str, List[str], None], profile: str) -> tuple:
+    """Answer cache scope: the documents asked about, the search mode and the decoding profile."""
+    documents = "all" if scope is None else tuple(sorted([scope] if isinstance(scope, str) else scope))
+    return documents, query.mode or config.SEARCH_MODE, profile
+
+async def lookup_answer(query: Query, scope: Union[str, List[str], None],
+                        profile: str) -> Tuple[Any, Optional[Dict[str, Any]]]:
+    """Embed the question and look up a cached answer, returning (embedding, answer or None).
+
+    Answers decoded with sampling are never cached.
+    """
+    if answer_cache is None or not (await get_engine("nlp")).is_deterministic(profile):
+        return None, None
+    vector_engine = await get_engine("vector")
+    
+    def encode(text: str):
+        # Catch up with the other workers first, dropping answers about documents they changed
+        vector_engine.sync()
+        return vector_engine.encode_query(text)
+    
+    try:
+        embedding = await run_stage("embedding", encode, query.text)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Answer cache lookup failed: {e}")
+        return None, None
+    
+    answer = answer_cache.get(answer_scope(query, scope, profile), embedding)
+    if answer and answer["audio_url"] and not os.path.exists(answer["audio_url"]):
+        # The audio file has been evicted from the TTS cache since
+        answer["audio_url"] = await synthesize(answer["response"])
+    return embedding, answer
+
+def store_answer(query: Query, scope: Union[str, List[str], None], profile: str,
+                 embedding: Any, answer: Dict[str, Any]):
+    if answer_cache is None or embedding is None:
+        return
+    documents = None if scope is None else set([scope] if isinstance(scope, str) else scope)
+    answer_cache.put(answer_scope(query, scope, profile), embedding, answer, documents)
+
 @app.post("/query")
 async def query_document(query: Query):
     try:
         if not query.text:
             raise HTTPException(status_code=400, detail="No query text provided")
             
-        if not query.document_id:
-            raise HTTPException(status_code=400, detail="No document ID provided")
+        scope = document_scope(query)
             
-        # Get relevant context from vector store
-        try:
-            context = vector_engine.search(query.text, query.document_id)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Error searching vector database: {str(e)}")
-        
-        # Generate response using NLP engine
-        try:
-            response = nl_engine.generate_response(query.text, context)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Error generating response: {str(e)}")
+        if query.mode and query.mode not in SEARCH_MODES:
+            raise HTTPException(status_code=400, detail=f"Unsupported search mode: {query.mode}")
+            
+        # Spreadsheet aggregates are computed exactly, skipping retrieval and generation
+        table_answer = await answer_from_table(query, scope)
+        embedding = None
+        profile = None
+        if table_answer:
+            response = table_answer["response"]
+            context = []
+        else:
+            vector_engine = await get_engine("vector")
+            nl_engine = await get_engine("nlp")
+            profile = await decoding_profile(query)
+            
+            # A near-identical question about the same documents was answered before
+            embedding, cached = await lookup_answer(query, scope, profile)
+            if cached:
+                return {
+                    "response": cached["response"],
+                    "audio_url": cached["audio_url"],
+                    "context": cached["context"],
+                    "table_result": None,
+                    "type": "assistant",
+                    "profile": profile,
+                    "cached": True
+                }
+            
+            # Get relevant context from vector store
+            try:
+                context = await run_stage("embedding", vector_engine.search, query.text, scope, mode=query.mode)
+            except HTTPException:
+                raise
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Error searching vector database: {str(e)}")
+            
+            # Generate response using NLP engine
+            try:
+                response = await run_stage("generation", nl_engine.generate_response, query.text, context, profile)
+            except HTTPException:
+                raise
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Error generating response: {str(e)}")
         
         # Convert response to speech
         try:
-            audio_url = voice_engine.text_to_speech(response)
+            audio_url = await synthesize(response)
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error converting text to speech: {str(e)}")
         
+        store_answer(query, scope, profile, embedding, {"response": response, "context": context, "audio_url": audio_url})
+        
         return {
             "response": response,
             "audio_url": audio_url,
             "context": context,
-            "type": "assistant"
+            "table_result": table_answer["table_result"] if table_answer else None,
+            "type": "assistant",
+            "profile": profile,
+            "cached": False
         }
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
-@app.post("/speech-to-text")
-async def speech_to_text(audio_file: UploadFile = File(...)):
+def sse_event(event: str, data: Any) -> str:
+    """Format a Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(events) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def answer_events(response: str, context: List[Dict[str, Any]], audio_url: Optional[str] = None, **extra):
+    """Events for an answer that is already complete (table results and cached answers)."""
     try:
-        if not audio_file.filename:
-            raise HTTPException(status_code=400, detail="No audio file provided")
-            
-        # Save the audio file
-        file_location = f"uploads/{audio_file.filename}"
+        yield sse_event("response", {"response": response, "type": "assistant", **extra})
+        yield sse_event("context", context)
+        if audio_url is None:
+            audio_url = await synthesize(response)
+        yield sse_event("audio", {"audio_url": audio_url})
+        yield sse_event("done", {})
+    except Exception as e:
+        yield sse_event("error", {"detail": str(e)})
+
+@app.post("/query/stream")
+async def query_document_stream(query: Query):
+    if not query.text:
+        raise HTTPException(status_code=400, detail="No query text provided")
+        
+    scope = document_scope(query)
+        
+    if query.mode and query.mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"Unsupported search mode: {query.mode}")
+        
+    table_answer = await answer_from_table(query, scope)
+    if table_answer:
+        return sse_response(answer_events(
+            table_answer["response"], [], table_result=table_answer["table_result"]
+        ))
+    
+    vector_engine = await get_engine("vector")
+    nl_engine = await get_engine("nlp")
+    profile = await decoding_profile(query, streaming=True)
+    
+    embedding, cached = await lookup_answer(query, scope, profile)
+    if cached:
+        return sse_response(answer_events(
+            cached["response"], cached["context"], cached["audio_url"], profile=profile, cached=True
+        ))
+    
+    # Retrieval happens before the stream opens so failures still map to status codes
+    try:
+        context = await run_stage("embedding", vector_engine.search, query.text, scope, mode=query.mode)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching vector database: {str(e)}")
+    
+    try:
+        pieces, generation = stream_generation(nl_engine, query.text, context, profile)
+    except StageBusyError as e:
+        raise stage_busy(e)
+
+    async def events():
         try:
-            with open(file_location, "wb+") as file_object:
-                file_object.write(await audio_file.read())
+            # Relay tokens as the model produces them
+            async for piece in pieces:
+                yield sse_event("token", {"text": piece})
+            
+            response = await asyncio.wrap_future(generation)
+            yield sse_event("response", {"response": response, "type": "assistant", "profile": profile})
+            yield sse_event("context", context)
+            
+            audio_url = await synthesize(response)
+            yield sse_event("audio", {"audio_url": audio_url})
+            yield sse_event("done", {})
+            store_answer(query, scope, profile, embedding, {"response": response, "context": context, "audio_url": audio_url})
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Error saving audio file: {str(e)}")
+            yield sse_event("error", {"detail": str(e)})
+
+    return sse_response(events())
+
+@app.delete("/documents/{document_id}")
+async def delete_document(document_id: str):
+    vector_engine = await get_engine("vector")
+    try:
+        deleted = await run_stage("embedding", vector_engine.delete_document, document_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error deleting document: {str(e)}")
+    if not deleted:
+        raise HTTPException(status_code=500, detail="Error deleting document")
+    
+    doc_processor.table_store.delete(document_id)
+    invalidated = answer_cache.invalidate(document_id) if answer_cache is not None else 0
+    return {"message": "Document deleted", "document_id": document_id, "invalidated_answers": invalidated}
+
+@app.get("/tts/stream")
+async def text_to_speech_stream(text: str = QueryParam(...), format: str = QueryParam("wav")):
+    if not text.strip():
+        raise HTTPException(status_code=400, detail="No text provided")
+    if format not in ("wav", "pcm"):
+        raise HTTPException(status_code=400, detail=f"Unsupported audio format: {format}")
         
-        # Convert speech to text
+    voice_engine = await get_engine("voice")
+    try:
+        audio_stream = inference_pool.stream("tts", voice_engine.text_to_speech_stream, text, format)
+    except StageBusyError as e:
+        raise stage_busy(e)
+    
+    sample_rate = voice_engine.tts_model.config.sampling_rate
+    return StreamingResponse(
+        audio_stream,
+        media_type="audio/wav" if format == "wav" else "audio/L16",
+        headers={"Cache-Control": "no-cache", "X-Sample-Rate": str(sample_rate)}
+    )
+
+async def save_audio_upload(audio_file: UploadFile) -> str:
+    """Save an uploaded recording in a directory of its own; remove it with remove_upload."""
+    if not audio_file.filename:
+        raise HTTPException(status_code=400, detail="No audio file provided")
+    
+    # Like /upload: never trust the client's path, and keep same-named uploads apart
+    upload_dir = os.path.join("uploads", str(uuid.uuid4()))
+    file_location = os.path.join(upload_dir, os.path.basename(audio_file.filename))
+    try:
+        os.makedirs(upload_dir, exist_ok=True)
+        with open(file_location, "wb+") as file_object:
+            file_object.write(await audio_file.read())
+    except Exception as e:
+        remove_upload(file_location)
+        raise HTTPException(status_code=500, detail=f"Error saving audio file: {str(e)}")
+    return file_location
+
+def remove_upload(file_location: str):
+    shutil.rmtree(os.path.dirname(file_location), ignore_errors=True)
+
+@app.post("/speech-to-text")
+async def speech_to_text(audio_file: UploadFile = File(...)):
+    try:
+        file_location = await save_audio_upload(audio_file)
         try:
-            text = voice_engine.speech_to_text(file_location)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Error converting speech to text: {str(e)}")
+            # Convert speech to text
+            voice_engine = await get_engine("voice")
+            try:
+                text = await run_stage("stt", voice_engine.speech_to_text, file_location)
+            except HTTPException:
+                raise
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Error converting speech to text: {str(e)}")
+        finally:
+            remove_upload(file_location)
         
         return {"text": text}
     except HTTPException:
@@ -132,5 +612,278 @@ async def speech_to_text(audio_file: UploadFile = File(...)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
+@app.post("/speech-to-text/stream")
+async def speech_to_text_stream(audio_file: UploadFile = File(...)):
+    """Transcribe a recording, sending the transcript so far as each window is decoded."""
+    file_location = await save_audio_upload(audio_file)
+    try:
+        voice_engine = await get_engine("voice")
+        partials = inference_pool.stream("stt", voice_engine.speech_to_text_stream, file_location)
+    except Exception as e:
+        remove_upload(file_location)
+        raise stage_busy(e) if isinstance(e, StageBusyError) else e
+    
+    async def events():
+        try:
+            text = ""
+            async for text in partials:
+                yield sse_event("partial", {"text": text})
+            yield sse_event("transcript", {"text": text})
+            yield sse_event("done", {})
+        except Exception as e:
+            yield sse_event("error", {"detail": f"Error converting speech to text: {str(e)}"})
+        finally:
+            # The recording is loaded with the first window; close the stream before removing it
+            await partials.aclose()
+            remove_upload(file_location)
+    
+    return sse_response(events())
+
+def server_timing(timings: Dict[str, float]) -> str:
+    """Server-Timing header value for stage durations in seconds."""
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+
+async def answer_sentences(voice_engine, text: str) -> AsyncIterator[str]:
+    for sentence in voice_engine.split_sentences(text):
+        yield sentence
+
+async def generated_sentences(voice_engine, nl_engine, pieces: AsyncIterator[str], generation) -> AsyncIterator[str]:
+    """Sentences of an answer as soon as generation has finished each one.
+
+    Nothing is spoken while the answer so far fails NLEngine.usable_response:
+    it may still turn out too short or repetitive, and then the final answer is
+    a fallback message instead.
+    """
+    text = ""
+    pending = ""
+    spoken = False
+    async for piece in pieces:
+        text += piece
+        pending += piece
+        # Once repetitive, an answer stays that way; hold the rest back
+        if not nl_engine.usable_response(text.strip()):
+            continue
+        sentences, pending = voice_engine.pop_sentences(pending)
+        for sentence in sentences:
+            spoken = True
+            yield sentence
+    # Raises if generation failed
+    response = await asyncio.wrap_future(generation)
+    if not spoken:
+        # The cleaned-up answer, which is the fallback message if the raw one was unusable
+        pending = response
+    elif not nl_engine.usable_response(text.strip()):
+        # It started repeating itself after the first sentences; stop there
+        pending = ""
+    sentences, pending = voice_engine.pop_sentences(pending)
+    for sentence in sentences:
+        yield sentence
+    if pending.strip():
+        yield pending.strip()
+
+@app.post("/voice-query")
+async def voice_query(audio_file: UploadFile = File(...), document_id: Optional[str] = Form(None),
+                      document_ids: Optional[str] = Form(None), mode: Optional[str] = Form(None),
+                      profile: Optional[str] = Form(None)):
+    """Answer a spoken question with speech, streamed as WAV.
+
+    document_ids is a comma-separated list or "all". The stages overlap: the
+    answer is spoken sentence by sentence while the rest is still being
+    generated. The response starts with the first sentence's audio; its
+    Server-Timing header breaks down the time spent until then, and
+    X-Transcript holds the recognized question (URL-encoded).
+    """
+    request_start = time.time()
+    timings = {}
+    audio = await audio_file.read()
+    if not audio:
+        raise HTTPException(status_code=400, detail="No audio file provided")
+    
+    # Transcribe straight from memory, without saving the upload
+    voice_engine = await get_engine("voice")
+    start_time = time.time()
+    try:
+        transcript = await run_stage("stt", voice_engine.speech_to_text, io.BytesIO(audio))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error converting speech to text: {str(e)}")
+    timings["stt"] = time.time() - start_time
+    # wav2vec2 transcribes in capitals
+    transcript = transcript.strip().lower()
+    if not transcript:
+        raise HTTPException(status_code=422, detail="No speech recognized")
+    
+    if document_ids and document_ids != "all":
+        document_ids = [doc_id.strip() for doc_id in document_ids.split(",") if doc_id.strip()]
+    query = Query(text=transcript, document_id=document_id, document_ids=document_ids, mode=mode, profile=profile)
+    scope = document_scope(query)
+    if query.mode and query.mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"Unsupported search mode: {query.mode}")
+    
+    # Retrieval starts as soon as the question is known
+    start_time = time.time()
+    profile = None
+    table_answer = await answer_from_table(query, scope)
+    if table_answer:
+        sentences = answer_sentences(voice_engine, table_answer["response"])
+        timings["table"] = time.time() - start_time
+    else:
+        vector_engine = await get_engine("vector")
+        nl_engine = await get_engine("nlp")
+        profile = await decoding_profile(query, streaming=True)
+        
+        _, cached = await lookup_answer(query, scope, profile)
+        if cached:
+            sentences = answer_sentences(voice_engine, cached["response"])
+            timings["cache"] = time.time() - start_time
+        else:
+            try:
+                context = await run_stage("embedding", vector_engine.search, query.text, scope, mode=query.mode)
+            except HTTPException:
+                raise
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Error searching vector database: {str(e)}")
+            timings["retrieval"] = time.time() - start_time
+            
+            try:
+                pieces, generation = stream_generation(nl_engine, query.text, context, profile)
+            except StageBusyError as e:
+                raise stage_busy(e)
+            sentences = generated_sentences(voice_engine, nl_engine, pieces, generation)
+    
+    # Speech starts with the first sentence, before the rest of the answer exists
+    start_time = time.time()
+    try:
+        first_sentence = await sentences.__anext__()
+    except StopAsyncIteration:
+        raise HTTPException(status_code=500, detail="Error generating response: empty answer")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating response: {str(e)}")
+    timings["first_sentence"] = time.time() - start_time
+    
+    start_time = time.time()
+    try:
+        first_audio = await run_stage("tts", voice_engine.sentence_pcm, first_sentence)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error converting text to speech: {str(e)}")
+    timings["tts"] = time.time() - start_time
+    timings["total"] = time.time() - request_start
+    
+    sample_rate = voice_engine.tts_model.config.sampling_rate
+    
+    async def speech():
+        yield voice_engine.streaming_wav_header(sample_rate)
+        yield first_audio
+        try:
+            # Each sentence is synthesized while generation carries on with the next
+            async for sentence in sentences:
+                yield await run_job_stage("tts", voice_engine.sentence_pcm, sentence)
+        except Exception as e:
+            # Headers are gone, all that's left is to end the audio early
+            print(f"Voice query stopped after the first sentence: {e}")
+    
+    return StreamingResponse(
+        speech(),
+        media_type="audio/wav",
+        headers={
+            "Cache-Control": "no-cache",
+            "Server-Timing": server_timing(timings),
+            "Timing-Allow-Origin": "*",
+            "X-Transcript": quote(transcript),
+            "X-Profile": profile or "",
+            "X-Sample-Rate": str(sample_rate),
+        }
+    )
+
+@app.websocket("/ws/speech-to-text")
+async def speech_to_text_live(websocket: WebSocket, sample_rate: int = 16000):
+    """Live transcription of 16-bit mono PCM sent as binary messages.
+
+    Sends {"type": "partial", "text": ...} while someone speaks and
+    {"type": "final", "text": ...} when they stop. The client sends the text
+    message {"type": "end"} to finish the utterance in progress right away.
+    """
+    await websocket.accept()
+    try:
+        voice_engine = await get_engine("voice")
+    except HTTPException as e:
+        await websocket.close(code=1013, reason=e.detail)
+        return
+    
+    # Needs scipy, like the voice engine, so it is only imported once speech is in use
+    from speech_stream import StreamingRecognizer
+    recognizer = StreamingRecognizer(voice_engine, sample_rate)
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes"):
+                work = recognizer.feed(message["bytes"])
+            elif message.get("text") and json.loads(message["text"]).get("type") == "end":
+                work = recognizer.end()
+            else:
+                continue
+            
+            for item in work:
+                if item == "final":
+                    # Final transcripts wait for the stt stage rather than being lost
+                    text = await run_job_stage("stt", recognizer.finalize)
+                    if text:
+                        await websocket.send_json({"type": "final", "text": text})
+                else:
+                    # Partials are skipped while the stage is saturated, the next one catches up
+                    try:
+                        text = await inference_pool.run("stt", recognizer.partial)
+                    except StageBusyError:
+                        continue
+                    if text:
+                        await websocket.send_json({"type": "partial", "text": text})
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"Live transcription failed: {e}")
+        await websocket.close(code=1011, reason=str(e)[:120])
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the server is up; reports each engine's load state."""
+    return {"status": "ok", "engines": engines.status()}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: every engine being warmed up has loaded."""
+    ready = engines.ready()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "loading", "engines": engines.status()}
+    )
+
+@app.get("/metrics")
+async def metrics():
+    # Only engines that are loaded report stats, asking must not load them
+    vector_engine = engines.peek("vector")
+    nl_engine = engines.peek("nlp")
+    voice_engine = engines.peek("voice")
+    return {
+        "engines": engines.status(),
+        "models": model_registry.stats(),
+        "pid": os.getpid(),
+        "inference_pool": inference_pool.stats(),
+        "generation_batcher": nl_engine.batcher.stats() if nl_engine else None,
+        "embedding_batcher": vector_engine.embedding_batcher.stats() if vector_engine else None,
+        "stt_batcher": voice_engine.stt_batcher.stats() if voice_engine else None,
+        "embedding_store": vector_engine.embedding_store.stats() if vector_engine else None,
+        "keyword_index": vector_engine.keyword_index.stats() if vector_engine else None,
+        "reranker": vector_engine.reranker.stats() if vector_engine and vector_engine.reranker else None,
+        "vector_startup": vector_engine.startup_stats if vector_engine else None,
+        "jobs": job_queue.stats(),
+        "tts_cache": voice_engine.audio_cache.stats() if voice_engine else None,
+        "answer_cache": answer_cache.stats() if answer_cache is not None else None
+    }
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
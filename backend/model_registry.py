@@ -0,0 +1,46 @@
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+# Loaded models by key, shared by every engine in the process
+_models: Dict[str, Any] = {}
+_load_seconds: Dict[str, float] = {}
+_key_locks: Dict[str, threading.Lock] = {}
+_lock = threading.Lock()
+
+
+def get_model(key: str, loader: Callable[[], Any]) -> Any:
+    """Return the model registered under key, calling loader the first time it is asked for.
+
+    Each model is loaded once per process. When the server preloads models before
+    forking its workers (see gunicorn.conf.py), the workers all use the parent's
+    copy: weights are only read, so their memory pages stay shared copy-on-write.
+    """
+    with _lock:
+        if key in _models:
+            return _models[key]
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+
+    # Different models can load at the same time, the same one only once
+    with key_lock:
+        with _lock:
+            if key in _models:
+                return _models[key]
+        start_time = time.time()
+        model = loader()
+        with _lock:
+            _models[key] = model
+            _load_seconds[key] = time.time() - start_time
+        print(f"Loaded {key} in {_load_seconds[key]:.2f} seconds")
+        return model
+
+
+def loaded() -> List[str]:
+    with _lock:
+        return list(_models)
+
+
+def stats() -> Dict[str, float]:
+    """Load time in seconds of every model in the registry."""
+    with _lock:
+        return {key: round(seconds, 3) for key, seconds in _load_seconds.items()}
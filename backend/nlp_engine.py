@@ -1,24 +1,90 @@
-from transformers import AutoModelForSeq2SeqLM, AutoTokenizer, pipeline
-from typing import List, Dict, Any
+from transformers import AutoTokenizer, TextStreamer, pipeline
+from typing import List, Dict, Any, Callable, Tuple
 import torch
 from functools import lru_cache
 import time
+import config
+from batching import MicroBatcher
+from context_packer import ContextPacker
+from generation_backends import load_generation_model
+import model_registry
+
+class _CallbackStreamer(TextStreamer):
+    """Hand each piece of decoded text to a callback as soon as it is final."""
+
+    def __init__(self, tokenizer, callback: Callable[[str], None]):
+        super().__init__(tokenizer, skip_prompt=True, skip_special_tokens=True)
+        self.callback = callback
+
+    def on_finalized_text(self, text: str, stream_end: bool = False):
+        if text:
+            self.callback(text)
 
 class NLEngine:
+    # Named decoding settings, trading answer quality for latency. Deterministic
+    # profiles always give the same answer for the same prompt, so their answers can be cached.
+    PROFILES = {
+        "fast": {"max_length": 128, "num_beams": 1, "do_sample": False, "repetition_penalty": 1.2},
+        "balanced": {"max_length": 200, "num_beams": 2, "do_sample": False, "repetition_penalty": 1.2},
+        "quality": {"max_length": 300, "num_beams": 4, "do_sample": False, "repetition_penalty": 1.2},
+        # The original settings: sampled beam search, not cacheable
+        "creative": {"max_length": 300, "num_beams": 4, "do_sample": True, "temperature": 0.7,
+                     "top_p": 0.9, "repetition_penalty": 1.2},
+    }
+
+    # Initialize with a model better suited for question answering
+    model_name = "google/flan-t5-base"  # Better for QA tasks
+
+    @classmethod
+    def load_models(cls) -> Dict[str, Any]:
+        """The engine's tokenizer and model, from the process-wide model registry."""
+        # Use the GPU if available; the backend (pytorch, int8, onnx, compile) comes from config
+        backend = config.GENERATION_BACKEND
+        model, device = model_registry.get_model(
+            f"generation:{cls.model_name}:{backend}",
+            lambda: load_generation_model(
+                cls.model_name,
+                backend=backend,
+                device="cuda" if torch.cuda.is_available() else "cpu",
+                export_dir=config.ONNX_EXPORT_DIR
+            )
+        )
+        return {
+            "tokenizer": model_registry.get_model(
+                f"tokenizer:{cls.model_name}", lambda: AutoTokenizer.from_pretrained(cls.model_name)
+            ),
+            "model": model,
+            "device": device,
+        }
+
     def __init__(self):
-        # Initialize with a model better suited for question answering
-        self.model_name = "google/flan-t5-base"  # Better for QA tasks
-        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-        self.model = AutoModelForSeq2SeqLM.from_pretrained(self.model_name)
-        
-        # Move model to GPU if available
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.model.to(self.device)
-        
-        # Enable model optimization
-        self.model.eval()  # Set to evaluation mode
-        if self.device == "cuda":
-            self.model = self.model.half()  # Use FP16 for faster inference
+        # A misspelt profile would otherwise only fail once a query asks for it
+        if config.GENERATION_PROFILE != "auto" and config.GENERATION_PROFILE not in self.PROFILES:
+            raise ValueError(
+                f"Unknown GENERATION_PROFILE {config.GENERATION_PROFILE!r}; "
+                f"expected \"auto\" or one of {', '.join(self.PROFILES)}"
+            )
+
+        models = self.load_models()
+        self.tokenizer = models["tokenizer"]
+        self.model = models["model"]
+        self.device = models["device"]
+        self.backend = config.GENERATION_BACKEND
+
+        # Prompts are packed into the model's input budget as token ids
+        self.packer = ContextPacker(
+            self.tokenizer,
+            max_tokens=config.GENERATION_MAX_INPUT_TOKENS,
+            cache_size=config.CONTEXT_TOKEN_CACHE_SIZE
+        )
+
+        # Concurrent questions are padded into a single generate call
+        self.batcher = MicroBatcher(
+            self._generate_batch,
+            max_batch_size=config.GENERATION_MAX_BATCH_SIZE,
+            max_wait=config.GENERATION_MAX_WAIT_MS / 1000,
+            name="generation"
+        )
 
     @lru_cache(maxsize=100)
     def _generate_cached(self, prompt: str) -> str:
@@ -26,71 +92,131 @@ class NLEngine:
         inputs = self.tokenizer(prompt, return_tensors="pt", max_length=512, truncation=True)
         inputs = {k: v.to(self.device) for k, v in inputs.items()}
         
+        # Deterministic decoding, otherwise caching the result would be meaningless
         with torch.no_grad():
             outputs = self.model.generate(
                 **inputs,
-                max_length=150,
+                **{**self.PROFILES["quality"], "max_length": 150},
                 num_return_sequences=1,
-                temperature=0.7,
-                top_p=0.9,
-                do_sample=True,
-                pad_token_id=self.tokenizer.eos_token_id,
-                num_beams=4,
-                repetition_penalty=1.2  # Prevent repetitive responses
+                pad_token_id=self.tokenizer.eos_token_id
             )
         
         return self.tokenizer.decode(outputs[0], skip_special_tokens=True)
 
-    def generate_response(self, query: str, context: List[Dict[str, Any]]) -> str:
-        """Generate a response based on the query and context."""
-        start_time = time.time()
-        
-        # Prepare the context - use more context items
-        context_text = "\n".join([item["content"] for item in context[:5]])  # Increased from 3 to 5
-        
-        # Create a better prompt that guides the model for list-type questions
-        prompt = f"""Context: {context_text}
+    def is_deterministic(self, profile: str) -> bool:
+        return not self.PROFILES[profile]["do_sample"]
 
-Question: {query}
+    def streaming_profile(self, profile: str) -> str:
+        """The profile to stream instead of `profile`: beam search can't stream, so
+        the beam profiles fall back to greedy "fast" decoding."""
+        return profile if self.PROFILES[profile]["num_beams"] == 1 else "fast"
 
-Based on the above context, please provide a complete and comprehensive answer. If the question asks for a list, make sure to include ALL items from the context. If the answer cannot be found in the context, say so.
+    def _generate_batch(self, items: List[Tuple[str, List[int]]]) -> List[str]:
+        """Generate answers for a batch of (profile, tokenized prompt) items.
 
-Answer:"""
-        
-        # Generate response with increased max length
-        inputs = self.tokenizer(prompt, return_tensors="pt", max_length=1024, truncation=True)  # Increased from 512
-        inputs = {k: v.to(self.device) for k, v in inputs.items()}
-        
-        with torch.no_grad():
-            outputs = self.model.generate(
-                **inputs,
-                max_length=300,  # Increased from 150
-                num_return_sequences=1,
-                temperature=0.7,
-                top_p=0.9,
-                do_sample=True,
-                pad_token_id=self.tokenizer.eos_token_id,
-                num_beams=4,
-                repetition_penalty=1.2
-            )
-        
-        response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+        Prompts sharing a decoding profile go through one padded forward pass.
+        """
+        by_profile = {}
+        for position, (profile, input_ids) in enumerate(items):
+            by_profile.setdefault(profile, []).append((position, input_ids))
         
+        responses = [None] * len(items)
+        for profile, group in by_profile.items():
+            inputs = self.tokenizer.pad({"input_ids": [input_ids for _, input_ids in group]}, return_tensors="pt")
+            inputs = {k: v.to(self.device) for k, v in inputs.items()}
+            
+            with torch.no_grad():
+                outputs = self.model.generate(
+                    **inputs,
+                    **self.PROFILES[profile],
+                    num_return_sequences=1,
+                    pad_token_id=self.tokenizer.eos_token_id
+                )
+            
+            for (position, _), response in zip(group, self.tokenizer.batch_decode(outputs, skip_special_tokens=True)):
+                responses[position] = response
+        return responses
+
+    def _build_prompt(self, query: str, context: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Pack the QA prompt into the input token budget (see ContextPacker.pack)."""
+        packed = self.packer.pack(query, context)
+        if packed["chunks_used"] < packed["chunks_total"]:
+            print(f"Prompt uses {packed['chunks_used']} of {packed['chunks_total']} chunks ({packed['tokens']} tokens)")
+        return packed
+
+    def usable_response(self, response: str) -> bool:
+        """Whether an answer is worth giving: long enough and not repeating its opening."""
+        return len(response) >= 20 and response.count(response[:20]) == 1
+
+    def _clean_response(self, response: str, prompt: str, context_text: str) -> str:
+        """Strip prompt echoes and swap unusable answers for a fallback message."""
         # Clean up response
         response = response.replace(prompt, "").strip()
         
         # If response is too short or repetitive, use a fallback
-        if len(response) < 20 or response.count(response[:20]) > 1:
+        if not self.usable_response(response):
             if context_text:
                 response = "Based on the document, I can see that it contains information, but I need more specific context to answer your question accurately. Could you please rephrase your question or ask about a specific aspect of the document?"
             else:
                 response = "I couldn't find relevant information in the document to answer your question. Could you please try rephrasing your question or ask about a different aspect of the document?"
         
+        return response
+
+    def generate_response(self, query: str, context: List[Dict[str, Any]], profile: str = "quality") -> str:
+        """Generate a response based on the query and context, decoding with the named profile."""
+        start_time = time.time()
+        if profile not in self.PROFILES:
+            raise ValueError(f"Unknown decoding profile: {profile}")
+        
+        packed = self._build_prompt(query, context)
+        
+        # Generate response, batched with any other questions arriving at the same time
+        response = self.batcher.process((profile, packed["input_ids"]))
+        response = self._clean_response(response, packed["prompt"], packed["context_text"])
+        
         processing_time = time.time() - start_time
-        print(f"Response generation took {processing_time:.2f} seconds")
+        print(f"Response generation took {processing_time:.2f} seconds ({profile})")
         
         return response
 
+    def stream_response(self, query: str, context: List[Dict[str, Any]], on_text: Callable[[str], None],
+                        profile: str = "fast") -> Callable[[], str]:
+        """Prepare a token-streaming generation.
+
+        Returns a blocking callable that runs the generation, calling on_text
+        with text pieces as they are decoded (on the generating thread), and
+        returns the final cleaned-up response. Beam search can't stream, so the
+        profile must decode with a single beam (see `streaming_profile`).
+        """
+        if profile not in self.PROFILES:
+            raise ValueError(f"Unknown decoding profile: {profile}")
+        if self.PROFILES[profile]["num_beams"] != 1:
+            raise ValueError(f"Decoding profile {profile} uses beam search and can't be streamed")
+        packed = self._build_prompt(query, context)
+        input_ids = torch.tensor([packed["input_ids"]], device=self.device)
+        inputs = {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
+        streamer = _CallbackStreamer(self.tokenizer, on_text)
+
+        def generate() -> str:
+            start_time = time.time()
+            with torch.no_grad():
+                outputs = self.model.generate(
+                    **inputs,
+                    **self.PROFILES[profile],
+                    pad_token_id=self.tokenizer.eos_token_id,
+                    streamer=streamer
+                )
+            
+            response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+            response = self._clean_response(response, packed["prompt"], packed["context_text"])
+            
+            processing_time = time.time() - start_time
+            print(f"Streamed response generation took {processing_time:.2f} seconds ({profile})")
+            
+            return response
+
+        return generate
+
     def analyze_document(self, content: str) -> Dict[str, Any]:
         """Analyze document content and extract key insights."""
         start_time = time.time()
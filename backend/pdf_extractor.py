@@ -0,0 +1,106 @@
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, Optional
+
+import PyPDF2
+import pytesseract
+
+try:
+    from pdf2image import convert_from_path
+except ImportError:  # OCR of scanned pages needs pdf2image and poppler
+    convert_from_path = None
+
+# Per-process state for pool workers, set up by _open_pdf
+_reader = None
+_file_path = None
+_ocr_dpi = 300
+
+
+def _open_pdf(file_path: str, ocr_dpi: int):
+    """Pool initializer: parse the PDF once per worker process."""
+    global _reader, _file_path, _ocr_dpi
+    _file_path = file_path
+    _ocr_dpi = ocr_dpi
+    _reader = PyPDF2.PdfReader(file_path)
+
+
+def _ocr_page(file_path: str, page_index: int, dpi: int) -> str:
+    """Rasterize a single page and run it through Tesseract."""
+    images = convert_from_path(
+        file_path, dpi=dpi, first_page=page_index + 1, last_page=page_index + 1, grayscale=True
+    )
+    return "\n".join(pytesseract.image_to_string(image) for image in images)
+
+
+def _extract_from(reader: PyPDF2.PdfReader, file_path: str, page_index: int, ocr_dpi: int) -> Dict[str, Any]:
+    """Extract one page's text, falling back to OCR when it has no text layer."""
+    start_time = time.time()
+    text = reader.pages[page_index].extract_text() or ""
+    ocr = False
+    if not text.strip() and convert_from_path is not None:
+        try:
+            text = _ocr_page(file_path, page_index, ocr_dpi)
+            ocr = True
+        except Exception as e:
+            print(f"OCR failed for page {page_index + 1}: {e}")
+    return {
+        "page": page_index + 1,
+        "text": text,
+        "ocr": ocr,
+        "seconds": time.time() - start_time,
+    }
+
+
+def _extract_page(page_index: int) -> Dict[str, Any]:
+    """Pool task: extract a page of the PDF opened by _open_pdf."""
+    return _extract_from(_reader, _file_path, page_index, _ocr_dpi)
+
+
+class PdfExtractor:
+    """Extract PDF text page by page, spreading pages over a process pool."""
+
+    def __init__(self, workers: int = 2, min_pages_for_pool: int = 8, ocr_dpi: int = 300):
+        self.workers = max(1, workers)
+        self.min_pages_for_pool = min_pages_for_pool
+        self.ocr_dpi = ocr_dpi
+        if convert_from_path is None:
+            print("pdf2image is not installed, scanned PDF pages will be skipped")
+
+    def page_count(self, file_path: str) -> int:
+        return len(PyPDF2.PdfReader(file_path).pages)
+
+    def iter_pages(self, file_path: str, pages_total: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """Yield {"page", "text", "ocr", "seconds"} for every page, in page order."""
+        if pages_total is None:
+            pages_total = self.page_count(file_path)
+
+        # Spawning processes isn't worth it for short documents
+        if self.workers == 1 or pages_total < self.min_pages_for_pool:
+            reader = PyPDF2.PdfReader(file_path)
+            for page_index in range(pages_total):
+                yield _extract_from(reader, file_path, page_index, self.ocr_dpi)
+            return
+
+        # spawn rather than fork: the server process has model threads running
+        context = multiprocessing.get_context("spawn")
+        workers = min(self.workers, pages_total)
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_open_pdf,
+            initargs=(file_path, self.ocr_dpi)
+        )
+        # Only a few pages are queued ahead of the consumer, so a failed or abandoned
+        # ingestion doesn't go on rasterizing and OCRing the rest of the document
+        pending = deque()
+        next_page = 0
+        try:
+            while next_page < pages_total or pending:
+                while next_page < pages_total and len(pending) < 2 * workers:
+                    pending.append(executor.submit(_extract_page, next_page))
+                    next_page += 1
+                yield pending.popleft().result()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List
+
+from sentence_transformers import CrossEncoder
+
+import model_registry
+
+
+class Reranker:
+    """Rerank retrieved chunks with a cross-encoder, caching (query, chunk id) scores.
+
+    A cross-encoder reads the query and chunk together, so it orders candidates far
+    better than embedding distance, at the cost of one model pass per pair; cached
+    scores make repeated and follow-up questions cheap.
+    """
+
+    def __init__(self, model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+                 batch_size: int = 16, cache_size: int = 10000):
+        self.model_name = model_name
+        self.model = self.load_model(model_name)
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def load_model(model_name: str) -> CrossEncoder:
+        return model_registry.get_model(f"cross-encoder:{model_name}", lambda: CrossEncoder(model_name, device="cpu"))
+
+    def rerank(self, query: str, results: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+        """Return the top_k results by cross-encoder score, each with a "rerank_score"."""
+        if not results:
+            return []
+        start_time = time.time()
+
+        scores = {}
+        with self._lock:
+            for result in results:
+                key = (query, result["id"])
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    scores[result["id"]] = self._cache[key]
+            self._hits += len(scores)
+            self._misses += len(results) - len(scores)
+
+        missing = [result for result in results if result["id"] not in scores]
+        if missing:
+            predicted = self.model.predict(
+                [(query, result["content"]) for result in missing],
+                batch_size=self.batch_size,
+                convert_to_numpy=True
+            )
+            with self._lock:
+                for result, score in zip(missing, predicted):
+                    scores[result["id"]] = float(score)
+                    self._cache[(query, result["id"])] = float(score)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        reranked = sorted(results, key=lambda result: scores[result["id"]], reverse=True)[:top_k]
+        print(f"Reranking took {time.time() - start_time:.2f} seconds for {len(results)} candidates "
+              f"({len(missing)} scored)")
+        return [{**result, "rerank_score": round(scores[result["id"]], 4)} for result in reranked]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "model": self.model_name,
+                "cached_scores": len(self._cache),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+            }
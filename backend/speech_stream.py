@@ -0,0 +1,188 @@
+import time
+from collections import deque
+from math import gcd
+from typing import Any, List, Optional
+
+import numpy as np
+from scipy.signal import resample_poly
+
+import config
+
+
+class _Utterance:
+    """Audio of one utterance, decoded in overlapping windows as it grows."""
+
+    def __init__(self, preroll: List[np.ndarray]):
+        self.frames = list(preroll)
+        # Token ids of windows already decoded for good, and context samples at the
+        # start of the remaining audio whose predictions were already committed
+        self.token_ids: List[np.ndarray] = []
+        self.left = 0
+        self.speech_ms = 0.0
+
+    def audio(self) -> np.ndarray:
+        if len(self.frames) > 1:
+            self.frames = [np.concatenate(self.frames)]
+        return self.frames[0] if self.frames else np.zeros(0, dtype=np.float32)
+
+
+class StreamingRecognizer:
+    """Turn a live stream of 16-bit PCM into partial and final transcripts.
+
+    `feed` is cheap: it runs an energy-based voice activity detector over the
+    incoming frames and returns the decoding work that is due, "partial" while
+    someone is speaking and "final" once they have been silent for
+    STT_VAD_SILENCE_MS. `partial` and `finalize` run the speech model through the
+    engine's batcher and must be called from a worker thread, one at a time.
+
+    Utterances longer than STT_CHUNK_SECONDS slide: their first window is decoded
+    for good, keeping the overlap as context, so each decode stays bounded however
+    long someone speaks.
+    """
+
+    def __init__(self, voice_engine: Any, sample_rate: int = 16000):
+        self.voice_engine = voice_engine
+        self.sample_rate = sample_rate
+        self.target_rate = voice_engine.stt_sampling_rate
+        factor = gcd(sample_rate, self.target_rate)
+        self._resample = (self.target_rate // factor, sample_rate // factor)
+        # Resampling state: input samples still needed, the index of the first (always
+        # a multiple of the downsampling factor), and how many outputs were returned.
+        # An output needs the input up to `_reach` samples either side of it; that's
+        # the half-length of resample_poly's filter
+        up, down = self._resample
+        self._reach = -(-10 * max(up, down) // up) + 1
+        self._input = np.zeros(0, dtype=np.float32)
+        self._input_start = 0
+        self._emitted = 0
+
+        self.frame_size = int(config.STT_STREAM_FRAME_MS * self.target_rate / 1000)
+        self.threshold = 10 ** (config.STT_VAD_THRESHOLD_DB / 20)
+        self.chunk = int(config.STT_CHUNK_SECONDS * self.target_rate)
+        self.stride = int(config.STT_STRIDE_SECONDS * self.target_rate)
+        self.partial_interval = int(config.STT_PARTIAL_INTERVAL_MS * self.target_rate / 1000)
+
+        self._remainder = np.zeros(0, dtype=np.float32)
+        self._preroll = deque(maxlen=max(1, int(config.STT_VAD_PREROLL_MS / config.STT_STREAM_FRAME_MS)))
+        self._current: Optional[_Utterance] = None
+        self._silence_ms = 0.0
+        self._since_partial = 0
+        self._finished = deque()
+
+    def _to_samples(self, pcm: bytes) -> np.ndarray:
+        samples = np.frombuffer(pcm[:len(pcm) // 2 * 2], dtype="<i2").astype(np.float32) / 32768
+        if self._resample != (1, 1):
+            samples = self._resample_stream(samples)
+        return samples
+
+    def _resample_stream(self, samples: np.ndarray) -> np.ndarray:
+        """Resample the stream so far, as if it were one signal.
+
+        Resampling each message on its own would taper its edges. Instead the
+        input is kept for as long as outputs still need it, and only outputs
+        whose filter lies wholly inside it are returned; the rest follow with
+        the next message.
+        """
+        up, down = self._resample
+        self._input = np.concatenate([self._input, samples])
+        output = resample_poly(self._input, up, down)
+
+        # Output j of the window sits at input position j * down / up
+        first = self._emitted - self._input_start // down * up
+        end = max(first, (len(self._input) - 1 - self._reach) * up // down + 1)
+        ready = output[first:end].astype(np.float32)
+        self._emitted += len(ready)
+
+        # Drop the input before the next output's reach, in whole steps of `down`
+        # so the window's outputs stay aligned with the stream's
+        position = (self._emitted - self._input_start // down * up) * down // up
+        drop = max(0, position - self._reach) // down * down
+        self._input = self._input[drop:]
+        self._input_start += drop
+        return ready
+
+    def _end_utterance(self, events: List[str]):
+        utterance, self._current = self._current, None
+        # Clicks and short noises aren't worth a transcription
+        if utterance.speech_ms >= config.STT_VAD_MIN_SPEECH_MS:
+            self._finished.append(utterance)
+            events.append("final")
+
+    def feed(self, pcm: bytes) -> List[str]:
+        """Add audio; returns the work now due, in order ("partial" / "final")."""
+        samples = np.concatenate([self._remainder, self._to_samples(pcm)])
+        usable = len(samples) // self.frame_size * self.frame_size
+        self._remainder = samples[usable:]
+
+        events = []
+        for start in range(0, usable, self.frame_size):
+            frame = samples[start:start + self.frame_size]
+            speech = float(np.sqrt(np.mean(frame ** 2))) >= self.threshold
+
+            if self._current is None:
+                self._preroll.append(frame)
+                if speech:
+                    self._current = _Utterance(self._preroll)
+                    self._preroll.clear()
+                    self._silence_ms = 0.0
+                    self._since_partial = 0
+                continue
+
+            self._current.frames.append(frame)
+            self._since_partial += len(frame)
+            if speech:
+                self._current.speech_ms += config.STT_STREAM_FRAME_MS
+                self._silence_ms = 0.0
+            else:
+                self._silence_ms += config.STT_STREAM_FRAME_MS
+                if self._silence_ms >= config.STT_VAD_SILENCE_MS:
+                    self._end_utterance(events)
+
+        if self._current is not None and self._since_partial >= self.partial_interval:
+            self._since_partial = 0
+            events.append("partial")
+        return events
+
+    def end(self) -> List[str]:
+        """The client stopped sending audio: end the utterance in progress, if any."""
+        events = []
+        if self._current is not None:
+            self._end_utterance(events)
+        return events
+
+    def _slide(self, utterance: _Utterance):
+        """Commit the windows that are complete, keeping their overlap as context."""
+        audio = utterance.audio()
+        windows = []
+        start = 0
+        while len(audio) - start >= self.chunk:
+            windows.append((audio[start:start + self.chunk], utterance.left, self.stride))
+            start += self.chunk - 2 * self.stride
+            utterance.left = self.stride
+        if windows:
+            futures = [self.voice_engine.stt_batcher.submit(window) for window in windows]
+            utterance.token_ids.extend(future.result() for future in futures)
+            utterance.frames = [audio[start:]]
+
+    def _decode(self, utterance: _Utterance) -> str:
+        self._slide(utterance)
+        audio = utterance.audio()
+        token_ids = list(utterance.token_ids)
+        if len(audio) > utterance.left:
+            token_ids.append(self.voice_engine.stt_batcher.process((audio, utterance.left, 0)))
+        return self.voice_engine.ctc_decode(token_ids)
+
+    def partial(self) -> Optional[str]:
+        """Transcript of the utterance in progress so far; None if it has ended meanwhile."""
+        if self._current is None:
+            return None
+        return self._decode(self._current)
+
+    def finalize(self) -> Optional[str]:
+        """Transcript of the oldest utterance that has ended, if any."""
+        if not self._finished:
+            return None
+        start_time = time.time()
+        text = self._decode(self._finished.popleft())
+        print(f"Final transcript decoded in {time.time() - start_time:.2f} seconds")
+        return text
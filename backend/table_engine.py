@@ -0,0 +1,254 @@
+import os
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+class TableStore:
+    """Columnar (Parquet) copies of uploaded spreadsheets, one file per sheet."""
+
+    def __init__(self, directory: str = "table_storage", cache_size: int = 8):
+        self.directory = directory
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _document_dir(self, doc_id: str) -> str:
+        return os.path.join(self.directory, doc_id)
+
+    @staticmethod
+    def _unique_columns(columns: Iterable[Any]) -> List[str]:
+        """Column names as text, with repeats renamed "name.1", "name.2", ...
+
+        Sheets often repeat a header name, but Parquet needs unique ones and
+        df[name] must be a single column.
+        """
+        unique = []
+        seen = set()
+        for column in (str(column) for column in columns):
+            name, suffix = column, 0
+            while name in seen:
+                suffix += 1
+                name = f"{column}.{suffix}"
+            seen.add(name)
+            unique.append(name)
+        return unique
+
+    @staticmethod
+    def _normalize(df: pd.DataFrame) -> pd.DataFrame:
+        """Make mixed-type columns Parquet friendly: numeric where possible, text otherwise."""
+        df = df.copy()
+        for column in df.columns:
+            if df[column].dtype == object:
+                numeric = pd.to_numeric(df[column], errors="coerce")
+                if numeric.notna().sum() == df[column].notna().sum():
+                    df[column] = numeric
+                else:
+                    df[column] = df[column].where(df[column].isna(), df[column].astype(str))
+        return df.reset_index(drop=True)
+
+    def save(self, doc_id: str, frames: Iterable[Tuple[str, pd.DataFrame]]):
+        """Write the sheets of a document, given as (sheet name, DataFrame) pieces."""
+        start_time = time.time()
+        sheets: Dict[str, List[pd.DataFrame]] = {}
+        for sheet_name, df in frames:
+            sheets.setdefault(sheet_name, []).append(df.set_axis(self._unique_columns(df.columns), axis=1))
+
+        document_dir = self._document_dir(doc_id)
+        temp_dir = f"{document_dir}.tmp"
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        os.makedirs(temp_dir)
+        for position, (sheet_name, pieces) in enumerate(sheets.items()):
+            df = self._normalize(pd.concat(pieces))
+            df.to_parquet(os.path.join(temp_dir, f"{position:03d}.parquet"), index=False)
+            with open(os.path.join(temp_dir, f"{position:03d}.name"), "w", encoding="utf-8") as file:
+                file.write(sheet_name)
+
+        shutil.rmtree(document_dir, ignore_errors=True)
+        os.replace(temp_dir, document_dir)
+        print(f"Table storage took {time.time() - start_time:.2f} seconds for {len(sheets)} sheets")
+
+    def has(self, doc_id: str) -> bool:
+        return os.path.isdir(self._document_dir(doc_id))
+
+    def load(self, doc_id: str) -> Dict[str, pd.DataFrame]:
+        """Load every sheet of a document, keeping recently used tables in memory."""
+        with self._lock:
+            if doc_id in self._cache:
+                self._cache.move_to_end(doc_id)
+                return self._cache[doc_id]
+
+        document_dir = self._document_dir(doc_id)
+        sheets = {}
+        for name in sorted(os.listdir(document_dir)):
+            if not name.endswith(".parquet"):
+                continue
+            with open(os.path.join(document_dir, name[:-len(".parquet")] + ".name"), "r", encoding="utf-8") as file:
+                sheet_name = file.read()
+            sheets[sheet_name] = pd.read_parquet(os.path.join(document_dir, name))
+
+        with self._lock:
+            self._cache[doc_id] = sheets
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return sheets
+
+    def delete(self, doc_id: str):
+        with self._lock:
+            self._cache.pop(doc_id, None)
+        shutil.rmtree(self._document_dir(doc_id), ignore_errors=True)
+
+
+class TableQueryEngine:
+    """Answer aggregate and filter questions about spreadsheets with pandas.
+
+    Handles questions like "what is the total of Amount for region East" or
+    "how many orders have quantity above 10" over the full table, and returns
+    None for anything it doesn't understand so the caller can fall back to
+    retrieval + generation.
+    """
+
+    # Checked in order, so "total number of" is a count rather than a sum
+    _AGGREGATES = [
+        ("count", r"\b(how many|count|number of)\b"),
+        ("sum", r"\b(total|sum)\b"),
+        ("mean", r"\b(average|mean|avg)\b"),
+        ("max", r"\b(maximum|max|highest|largest|biggest)\b"),
+        ("min", r"\b(minimum|min|lowest|smallest)\b"),
+    ]
+    _COMPARISONS = [
+        (r"(greater than|more than|above|over|>)", "gt"),
+        (r"(less than|fewer than|below|under|<)", "lt"),
+        (r"(equal to|equals|=|is)", "eq"),
+    ]
+    _LABELS = {"sum": "total", "mean": "average", "max": "maximum", "min": "minimum", "count": "number of rows"}
+
+    def __init__(self, table_store: TableStore, max_filter_values: int = 10000):
+        self.table_store = table_store
+        self.max_filter_values = max_filter_values
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        """Lower-case words only, for matching column names and cell values."""
+        return " ".join(re.sub(r"[^a-z0-9]+", " ", str(text).lower()).split())
+
+    @staticmethod
+    def _normalize_question(text: str) -> str:
+        """Like _normalize, but keeps decimal points and comparison symbols."""
+        return " ".join(re.sub(r"[^a-z0-9.<>=\-]+", " ", text.lower()).split())
+
+    def _detect_aggregate(self, question: str) -> Optional[str]:
+        for name, pattern in self._AGGREGATES:
+            if re.search(pattern, question):
+                return name
+        return None
+
+    def _find_column(self, question: str, columns: List[str]) -> Optional[str]:
+        """Longest column name mentioned in the question."""
+        mentioned = [
+            column for column in columns
+            if self._normalize(column) and re.search(rf"\b{re.escape(self._normalize(column))}\b", question)
+        ]
+        return max(mentioned, key=lambda column: len(self._normalize(column))) if mentioned else None
+
+    def _build_filters(self, question: str, df: pd.DataFrame, target: Optional[str]) -> Tuple[np.ndarray, List[str]]:
+        """Row mask and human-readable descriptions for conditions found in the question."""
+        mask = np.ones(len(df), dtype=bool)
+        descriptions = []
+        for column in df.columns:
+            if column == target:
+                continue
+            name = self._normalize(column)
+            if not name:
+                continue
+            series = df[column]
+
+            if pd.api.types.is_numeric_dtype(series):
+                # Numeric conditions: "<column> above 10", "<column> = 3"
+                for words, operator in self._COMPARISONS:
+                    match = re.search(rf"\b{re.escape(name)}\s+{words}\s+(-?\d+(?:\.\d+)?)", question)
+                    if match:
+                        value = float(match.group(2))
+                        condition = {"gt": series > value, "lt": series < value, "eq": series == value}[operator]
+                        mask &= condition.fillna(False).to_numpy()
+                        symbol = {"gt": ">", "lt": "<", "eq": "="}[operator]
+                        descriptions.append(f"{column} {symbol} {value:g}")
+                        break
+                continue
+
+            # Categorical conditions: a value of this column is mentioned in the question
+            values = series.dropna().unique()
+            if len(values) > self.max_filter_values:
+                continue
+            normalized = {self._normalize(value): value for value in values}
+            matches = [
+                key for key in normalized
+                if len(key) >= 3 and re.search(rf"\b{re.escape(key)}\b", question)
+            ]
+            if matches:
+                key = max(matches, key=len)
+                cells = series.astype(str).str.lower().str.replace(r"[^a-z0-9]+", " ", regex=True).str.strip()
+                mask &= (cells == key).to_numpy()
+                descriptions.append(f"{column} is {normalized[key]}")
+        return mask, descriptions
+
+    def answer(self, question: str, doc_id: str) -> Optional[Dict[str, Any]]:
+        """Compute an answer over the stored tables, or None if the question isn't a table query."""
+        if not self.table_store.has(doc_id):
+            return None
+        start_time = time.time()
+        normalized_question = self._normalize_question(question)
+        aggregate = self._detect_aggregate(normalized_question)
+        if aggregate is None:
+            return None
+
+        for sheet_name, df in self.table_store.load(doc_id).items():
+            # Counting needs no target column, every mentioned column can act as a filter
+            target = None
+            if aggregate != "count":
+                numeric_columns = [column for column in df.columns if pd.api.types.is_numeric_dtype(df[column])]
+                target = self._find_column(normalized_question, numeric_columns)
+                if target is None:
+                    continue
+
+            mask, descriptions = self._build_filters(normalized_question, df, target)
+            if aggregate == "count" and not descriptions:
+                # An unfiltered "how many" must at least be about this table
+                about_table = re.search(r"\b(rows|records|entries|lines)\b", normalized_question)
+                if not about_table and self._find_column(normalized_question, list(df.columns)) is None:
+                    continue
+            if aggregate == "count":
+                value = int(mask.sum())
+            else:
+                rows = df[target][mask]
+                if not rows.notna().any():
+                    continue
+                value = getattr(rows, aggregate)()
+                value = value.item() if hasattr(value, "item") else value
+
+            label = self._LABELS[aggregate]
+            subject = f"{label} of {target}" if target is not None else label
+            conditions = f" where {' and '.join(descriptions)}" if descriptions else ""
+            formatted = f"{value:,}" if isinstance(value, int) else f"{value:,.2f}"
+            response = f"The {subject}{conditions} is {formatted} (sheet {sheet_name}, {int(mask.sum())} matching rows)."
+
+            print(f"Table query took {time.time() - start_time:.3f} seconds")
+            return {
+                "response": response,
+                "table_result": {
+                    "sheet": sheet_name,
+                    "aggregate": aggregate,
+                    "column": target,
+                    "filters": descriptions,
+                    "value": value,
+                    "rows": int(mask.sum()),
+                },
+            }
+        return None
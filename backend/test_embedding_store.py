@@ -0,0 +1,60 @@
+import multiprocessing
+import os
+import tempfile
+
+from embedding_store import EmbeddingStore
+
+
+def _record_changes(path: str, doc_ids):
+    store = EmbeddingStore(path)
+    for doc_id in doc_ids:
+        store.record_change(doc_id)
+
+
+def _in_other_process(path: str, doc_ids):
+    process = multiprocessing.get_context("spawn").Process(target=_record_changes, args=(path, doc_ids))
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+
+
+def test_changes_since_skips_own_changes():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "embeddings.sqlite3")
+        store = EmbeddingStore(path)
+        assert store.changes_since(0) == (0, [])
+
+        store.record_change("mine")
+        seq, changed = store.changes_since(0)
+        assert seq == 1 and changed == []
+
+        _in_other_process(path, ["theirs", "theirs", "other"])
+        store.record_change("mine again")
+        seq, changed = store.changes_since(seq)
+        assert seq == 5
+        assert sorted(changed) == ["other", "theirs"]
+
+        # Nothing new since the last check
+        assert store.changes_since(seq) == (seq, [])
+
+
+def test_changes_since_pruned_log():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "embeddings.sqlite3")
+        store = EmbeddingStore(path)
+        store.CHANGE_LOG_SIZE = 3
+        _in_other_process(path, ["a", "b"])
+        seq, changed = store.changes_since(0)
+        assert seq == 2 and sorted(changed) == ["a", "b"]
+
+        for doc_id in ["c", "d", "e"]:
+            store.record_change(doc_id)
+        # Changes 1 and 2 were pruned, so a process that last saw 0 must refresh everything
+        assert store.changes_since(0) == (5, None)
+        assert store.changes_since(2) == (5, [])
+
+
+if __name__ == "__main__":
+    for test in [test_changes_since_skips_own_changes, test_changes_since_pruned_log]:
+        test()
+        print(f"✓ {test.__name__}")
@@ -0,0 +1,60 @@
+import numpy as np
+from scipy.signal import resample_poly
+
+from speech_stream import StreamingRecognizer
+
+
+class _VoiceEngine:
+    stt_sampling_rate = 16000
+
+
+def _pcm(samples: np.ndarray) -> bytes:
+    return (samples * 32767).astype("<i2").tobytes()
+
+
+def _stream(sample_rate: int, message_sizes):
+    """Resample a tone sent in messages of the given sizes, cycling through them."""
+    rng = np.random.default_rng(0)
+    t = np.arange(sample_rate * 2) / sample_rate
+    signal = 0.5 * np.sin(2 * np.pi * 440 * t) + 0.05 * rng.standard_normal(len(t))
+    pcm = _pcm(signal)
+
+    recognizer = StreamingRecognizer(_VoiceEngine(), sample_rate=sample_rate)
+    pieces, start, i = [], 0, 0
+    while start < len(signal):
+        size = message_sizes[i % len(message_sizes)]
+        pieces.append(recognizer._to_samples(pcm[start * 2:(start + size) * 2]))
+        start += size
+        i += 1
+
+    samples = np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768
+    up, down = recognizer._resample
+    return np.concatenate(pieces), resample_poly(samples, up, down), recognizer
+
+
+def test_resampling_is_continuous_across_messages():
+    for sample_rate, sizes in [(8000, [160]), (44100, [441, 1000, 37, 4410]), (48000, [1, 7, 960, 3])]:
+        streamed, whole, recognizer = _stream(sample_rate, sizes)
+        up, down = recognizer._resample
+        # Only the last outputs, whose filter reaches past the end, are still held back
+        assert len(whole) - len(streamed) <= recognizer._reach * up // down + 1, sample_rate
+        np.testing.assert_allclose(streamed, whole[:len(streamed)], atol=1e-5)
+
+
+def test_resampling_keeps_a_bounded_window():
+    _, _, recognizer = _stream(44100, [441])
+    up, down = recognizer._resample
+    assert len(recognizer._input) <= 2 * recognizer._reach + 441 + down
+
+
+def test_no_resampling_at_the_model_rate():
+    streamed, whole, recognizer = _stream(16000, [320, 17])
+    assert recognizer._resample == (1, 1)
+    np.testing.assert_array_equal(streamed, whole)
+
+
+if __name__ == "__main__":
+    for test in [test_resampling_is_continuous_across_messages, test_resampling_keeps_a_bounded_window,
+                 test_no_resampling_at_the_model_rate]:
+        test()
+        print(f"✓ {test.__name__}")
@@ -2,16 +2,43 @@ import os
 import chromadb
 from chromadb.config import Settings
 from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional, Union
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import numpy as np
+import hashlib
+import threading
 import uuid
-from functools import lru_cache
 import time
 import re
+import config
+from batching import MicroBatcher, prefetch
+from embedding_store import EmbeddingStore
+from bm25_index import BM25Index
+from reranker import Reranker
+import model_registry
 
 class VectorEngine:
+    # A better model for semantic search
+    model_name = 'all-mpnet-base-v2'
+
+    @classmethod
+    def load_models(cls) -> Dict[str, Any]:
+        """The engine's weights, from the process-wide model registry."""
+        models = {
+            "embedding": model_registry.get_model(
+                f"sentence-transformer:{cls.model_name}",
+                lambda: SentenceTransformer(cls.model_name, device='cpu')
+            )
+        }
+        if config.RERANK_ENABLED:
+            models["reranker"] = Reranker.load_model(config.RERANK_MODEL)
+        return models
+
     def __init__(self):
-        # Initialize with a better model for semantic search
-        self.model = SentenceTransformer('all-mpnet-base-v2', device='cpu')
+        start_time = time.time()
+        
+        self.model = self.load_models()["embedding"]
         
         # Define embedding function class for ChromaDB
         class CustomEmbeddingFunction:
@@ -22,81 +49,299 @@ class VectorEngine:
                     input = [input]
                 return self.model.encode(input).tolist()
 
-        # Initialize ChromaDB with optimized settings
-        self.client = chromadb.Client(Settings(
-            persist_directory="vector_storage",
+        # Initialize ChromaDB with optimized settings. chromadb.Client is in-memory
+        # since 0.4, so the on-disk PersistentClient is what keeps documents across
+        # restarts. Embedded clients keep their indexes to themselves, so server
+        # processes sharing one corpus talk to a Chroma server instead
+        settings = Settings(
             anonymized_telemetry=False,
             allow_reset=True
-        ))
+        )
+        if config.VECTOR_BACKEND == "persistent":
+            self.client = chromadb.PersistentClient(path=config.VECTOR_STORAGE_PATH, settings=settings)
+        elif config.VECTOR_BACKEND == "http":
+            self.client = chromadb.HttpClient(host=config.CHROMA_HOST, port=config.CHROMA_PORT, settings=settings)
+        elif config.VECTOR_BACKEND == "memory":
+            self.client = chromadb.Client(settings)
+        else:
+            raise ValueError(f"Unsupported vector backend: {config.VECTOR_BACKEND}")
         
-        # Create or get the collection with explicit embedding function
+        # Embeddings of previously seen chunks and hashes of ingested files
+        self.embedding_store = EmbeddingStore(config.EMBEDDING_STORE_PATH)
+        
+        # The keyword index and the answer cache are kept by each server process; the
+        # store's change log tells them when another one changed the corpus (see
+        # sync). Everything loaded below is already up to date.
+        self._seen_change, _ = self.embedding_store.changes_since(0)
+        self._sync_lock = threading.Lock()
+        self._change_listeners = []
+        
+        self._embedding_function = CustomEmbeddingFunction(self.model)
+        self._collection_metadata = {
+            "hnsw:space": "cosine",
+            "hnsw:construction_ef": 200,  # Increased for better accuracy
+            "hnsw:search_ef": 100,  # Increased for better accuracy
+        }
+        
+        # Documents are spread over a fixed number of "shard_<n>" collections by a hash of
+        # their id, so a corpus-wide query searches VECTOR_SHARDS indexes however many
+        # documents there are, and a document query filters one shard by doc_id. The
+        # shared "documents" collection holds documents stored before sharding and is
+        # still searched for them.
         self.collection = self.client.get_or_create_collection(
             name="documents",
-            embedding_function=CustomEmbeddingFunction(self.model),
-            metadata={
-                "hnsw:space": "cosine",
-                "hnsw:construction_ef": 200,  # Increased for better accuracy
-                "hnsw:search_ef": 100,  # Increased for better accuracy
-            }
+            embedding_function=self._embedding_function,
+            metadata=self._collection_metadata
+        )
+        self._shards = [
+            self.client.get_or_create_collection(
+                name=f"shard_{shard}",
+                embedding_function=self._embedding_function,
+                metadata=self._collection_metadata
+            )
+            for shard in range(config.VECTOR_SHARDS)
+        ]
+        self._legacy_documents = set()
+        
+        # Shards of a query are searched in parallel
+        self._search_executor = ThreadPoolExecutor(
+            max_workers=config.SEARCH_WORKERS, thread_name_prefix="search"
         )
 
-    @lru_cache(maxsize=1000)
-    def _encode_text(self, text: str) -> List[float]:
-        """Cached version of text encoding."""
-        return self.model.encode(text).tolist()
+        # Chunks from concurrent uploads are encoded together in fixed-size batches
+        self.embedding_batcher = MicroBatcher(
+            self._encode_batch,
+            max_batch_size=config.EMBEDDING_BATCH_SIZE,
+            max_wait=config.EMBEDDING_MAX_WAIT_MS / 1000,
+            name="embedding"
+        )
+        
+        # Keyword index for exact terms (identifiers, names) that embeddings miss
+        self.keyword_index = BM25Index(
+            config.KEYWORD_INDEX_PATH if config.VECTOR_BACKEND != "memory" else None
+        )
+        
+        # Optional cross-encoder that reorders an over-fetched candidate list
+        self.reranker = Reranker(
+            config.RERANK_MODEL,
+            batch_size=config.RERANK_BATCH_SIZE,
+            cache_size=config.RERANK_CACHE_SIZE
+        ) if config.RERANK_ENABLED else None
+        
+        # Recent query embeddings, kept apart from document chunks
+        self._query_cache = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+        
+        self.startup_stats = self._warm_start(start_time)
+
+    def on_documents_changed(self, callback: Callable[[Optional[str]], Any]):
+        """Have sync call callback with each document another process stored or deleted (None: any may have)."""
+        self._change_listeners.append(callback)
+
+    def sync(self):
+        """Catch up with documents other server processes stored or deleted.
+
+        The vectors are in the shared Chroma server already; only the changed
+        documents' keyword index partitions are read again, and the listeners
+        drop what they cached about them. When nothing changed this is a single
+        SQLite query.
+        """
+        if config.VECTOR_BACKEND == "memory":
+            return
+        with self._sync_lock:
+            self._seen_change, changed = self.embedding_store.changes_since(self._seen_change)
+            if changed == []:
+                return
+            start_time = time.time()
+            if changed is None:
+                self.keyword_index.reload()
+                self._legacy_documents = self._collection_documents(self.collection)
+            else:
+                for doc_id in changed:
+                    self.keyword_index.reload_document(doc_id)
+                    self._legacy_documents.discard(doc_id)
+            print(f"Synced {'all' if changed is None else len(changed)} documents changed by other processes "
+                  f"in {time.time() - start_time:.2f} seconds")
+        for doc_id in ([None] if changed is None else changed):
+            for callback in self._change_listeners:
+                callback(doc_id)
+
+    @staticmethod
+    def _collection_documents(collection) -> set:
+        """Ids of the documents with chunks in collection."""
+        # Every document has exactly one chunk with index 0
+        first_chunks = collection.get(where={"chunk_index": 0}, include=["metadatas"])
+        return {metadata["doc_id"] for metadata in first_chunks['metadatas']}
+
+    def _warm_start(self, start_time: float) -> Dict[str, Any]:
+        """Load the HNSW indexes now instead of on the first query and report what was restored."""
+        index_start = time.time()
+        self._migrate_document_collections()
+        
+        chunks = 0
+        documents = 0
+        for collection in [self.collection] + self._shards:
+            count = collection.count()
+            if not count:
+                continue
+            chunks += count
+            doc_ids = self._collection_documents(collection)
+            documents += len(doc_ids)
+            if collection is self.collection:
+                self._legacy_documents = doc_ids
+            
+            # Chroma loads an index lazily, a single query pulls it into memory
+            sample = collection.peek(limit=1)
+            collection.query(query_embeddings=[list(sample['embeddings'][0])], n_results=1, include=[])
+        index_time = time.time() - index_start
+        total_time = time.time() - start_time
+        
+        stats = {
+            "backend": config.VECTOR_BACKEND,
+            "documents": documents,
+            "chunks": chunks,
+            "index_load_seconds": round(index_time, 3),
+            "startup_seconds": round(total_time, 3),
+            "budget_seconds": config.WARM_START_BUDGET_SECONDS,
+            "within_budget": total_time <= config.WARM_START_BUDGET_SECONDS,
+        }
+        print(f"Vector store restored {documents} documents ({chunks} chunks) in {total_time:.2f} seconds")
+        if not stats["within_budget"]:
+            print(f"Warning: vector store warm start exceeded its {config.WARM_START_BUDGET_SECONDS:.0f}s budget")
+        return stats
+
+    def _encode_batch(self, texts: List[str]) -> List[np.ndarray]:
+        """Encode a batch of texts in a single model call."""
+        embeddings = self.model.encode(texts, batch_size=len(texts), convert_to_numpy=True)
+        return list(embeddings.astype(np.float32, copy=False))
+
+    def _encode_chunks(self, chunks: List[str]) -> np.ndarray:
+        """Encode document chunks, embedding each distinct chunk only once.
+
+        Chunks already in the persistent embedding store are not encoded again.
+        """
+        if not chunks:
+            return np.empty((0, 0), dtype=np.float32)
+        
+        hashes = {chunk: EmbeddingStore.content_hash(chunk) for chunk in dict.fromkeys(chunks)}
+        stored = self.embedding_store.get_many(self.model_name, list(hashes.values()))
+        
+        missing = [chunk for chunk, content_hash in hashes.items() if content_hash not in stored]
+        futures = [self.embedding_batcher.submit(chunk) for chunk in missing]
+        encoded = {hashes[chunk]: future.result() for chunk, future in zip(missing, futures)}
+        if encoded:
+            self.embedding_store.put_many(self.model_name, encoded)
+        
+        vectors = {**stored, **encoded}
+        return np.stack([vectors[hashes[chunk]] for chunk in chunks])
+
+    def _shard(self, doc_id: str):
+        """The shard collection new chunks of doc_id go to (stable across processes and restarts)."""
+        digest = hashlib.md5(doc_id.encode("utf-8")).digest()
+        return self._shards[int.from_bytes(digest[:4], "big") % len(self._shards)]
+
+    def _collection_for(self, doc_id: str):
+        """The collection holding doc_id's chunks."""
+        return self.collection if doc_id in self._legacy_documents else self._shard(doc_id)
+
+    def _migrate_document_collections(self):
+        """Move documents from the earlier one-collection-per-document layout into the shards."""
+        for collection in self.client.list_collections():
+            if not collection.name.startswith("doc_"):
+                continue
+            doc_id = collection.name[len("doc_"):]
+            try:
+                stored = collection.get(include=["embeddings", "documents", "metadatas"])
+                if stored['ids']:
+                    self._shard(doc_id).upsert(
+                        ids=stored['ids'],
+                        embeddings=[list(embedding) for embedding in stored['embeddings']],
+                        documents=stored['documents'],
+                        metadatas=stored['metadatas']
+                    )
+                self.client.delete_collection(name=collection.name)
+            except Exception as e:
+                # Server processes sharing a Chroma server start together; another one got there first
+                print(f"Skipping document {doc_id}, already moved: {e}")
+                continue
+            print(f"Moved document {doc_id} ({len(stored['ids'])} chunks) into its shard")
+
+    def _delete_chunks(self, doc_id: str):
+        self._collection_for(doc_id).delete(where={"doc_id": doc_id})
+
+    def _has_document(self, doc_id: str) -> bool:
+        """Check whether any chunks are stored for doc_id."""
+        return bool(self._collection_for(doc_id).get(where={"doc_id": doc_id}, limit=1)['ids'])
+
+    def encode_query(self, text: str) -> np.ndarray:
+        """Encode a search query, reusing recent results."""
+        with self._query_cache_lock:
+            if text in self._query_cache:
+                self._query_cache.move_to_end(text)
+                return self._query_cache[text]
+        
+        embedding = self.model.encode(text, convert_to_numpy=True).astype(np.float32, copy=False)
+        
+        with self._query_cache_lock:
+            self._query_cache[text] = embedding
+            if len(self._query_cache) > config.QUERY_EMBEDDING_CACHE_SIZE:
+                self._query_cache.popitem(last=False)
+        return embedding
 
     def _split_into_chunks(self, text: str, max_chunk_size: int = 500) -> List[str]:
         """Split text into meaningful chunks."""
-        # First split by paragraphs
-        paragraphs = re.split(r'\n\s*\n', text)
-        chunks = []
+        return list(self._iter_chunks([{"text": text}], max_chunk_size))
+
+    def _iter_chunks(self, blocks: Iterable[Dict[str, Any]], max_chunk_size: int = 500) -> Iterator[str]:
+        """Incrementally group a stream of text blocks into meaningful chunks."""
         current_chunk = []
         current_size = 0
 
-        for paragraph in paragraphs:
-            paragraph = paragraph.strip()
-            if not paragraph:
+        for block in blocks:
+            # Self-describing blocks (e.g. spreadsheet row groups) become chunks as they are
+            if block.get("standalone"):
+                if current_chunk:
+                    yield ' '.join(current_chunk)
+                    current_chunk = []
+                    current_size = 0
+                yield block["text"]
                 continue
 
-            # If paragraph is too long, split it into sentences
-            if len(paragraph) > max_chunk_size:
-                sentences = re.split(r'(?<=[.!?])\s+', paragraph)
-                for sentence in sentences:
-                    if current_size + len(sentence) > max_chunk_size and current_chunk:
-                        chunks.append(' '.join(current_chunk))
+            # Blocks may still contain several paragraphs
+            for paragraph in re.split(r'\n\s*\n', block["text"]):
+                paragraph = paragraph.strip()
+                if not paragraph:
+                    continue
+
+                # If paragraph is too long, split it into sentences
+                if len(paragraph) > max_chunk_size:
+                    sentences = re.split(r'(?<=[.!?])\s+', paragraph)
+                    for sentence in sentences:
+                        if current_size + len(sentence) > max_chunk_size and current_chunk:
+                            yield ' '.join(current_chunk)
+                            current_chunk = []
+                            current_size = 0
+                        current_chunk.append(sentence)
+                        current_size += len(sentence)
+                else:
+                    if current_size + len(paragraph) > max_chunk_size and current_chunk:
+                        yield ' '.join(current_chunk)
                         current_chunk = []
                         current_size = 0
-                    current_chunk.append(sentence)
-                    current_size += len(sentence)
-            else:
-                if current_size + len(paragraph) > max_chunk_size and current_chunk:
-                    chunks.append(' '.join(current_chunk))
-                    current_chunk = []
-                    current_size = 0
-                current_chunk.append(paragraph)
-                current_size += len(paragraph)
+                    current_chunk.append(paragraph)
+                    current_size += len(paragraph)
 
         if current_chunk:
-            chunks.append(' '.join(current_chunk))
-
-        return chunks
+            yield ' '.join(current_chunk)
 
-    def store_document(self, document: Dict[str, Any], filename: str) -> str:
-        """Store document content in the vector database."""
-        start_time = time.time()
-        
-        # Generate a unique ID for the document
-        doc_id = str(uuid.uuid4())
-        
-        # Split content into meaningful chunks
-        chunks = self._split_into_chunks(document['content'])
+    def _add_chunks(self, doc_id: str, filename: str, document: Dict[str, Any], chunks: List[str], first_index: int):
+        """Embed a batch of chunks and insert it into the document's shard."""
+        embeddings = self._encode_chunks(chunks)
+        indexes = range(first_index, first_index + len(chunks))
         
-        # Generate embeddings for chunks
-        embeddings = [self._encode_text(chunk) for chunk in chunks]
-        
-        # Store in ChromaDB
-        self.collection.add(
-            embeddings=embeddings,
+        # Store in ChromaDB (0.4.x only accepts plain lists, so convert once here)
+        self._shard(doc_id).add(
+            embeddings=embeddings.tolist(),
             documents=chunks,
             metadatas=[{
                 "doc_id": doc_id,
@@ -104,55 +349,236 @@ class VectorEngine:
                 "file_type": document['file_type'],
                 "chunk_index": i,
                 **document['metadata']
-            } for i in range(len(chunks))],
-            ids=[f"{doc_id}_{i}" for i in range(len(chunks))]
+            } for i in indexes],
+            ids=[f"{doc_id}_{i}" for i in indexes]
         )
-        
-        processing_time = time.time() - start_time
-        print(f"Document storage took {processing_time:.2f} seconds")
-        
-        return doc_id
+        self.keyword_index.add_chunks(doc_id, [f"{doc_id}_{i}" for i in indexes], chunks)
+
+    def store_document(self, document: Dict[str, Any], filename: str,
+                       progress: Optional[Callable[..., None]] = None) -> str:
+        """Store document content in the vector database.
 
-    def search(self, query: str, document_id: str = None, top_k: int = 5) -> List[Dict[str, Any]]:
-        """Search for relevant content in the vector database."""
+        progress, if given, is called with chunks_total and chunks_embedded counters.
+        """
+        return self.store_document_stream(document, [{"text": document['content']}], filename, progress)
+
+    def store_document_stream(self, document: Dict[str, Any], blocks: Iterable[Dict[str, Any]], filename: str,
+                              progress: Optional[Callable[..., None]] = None) -> str:
+        """Store a document given as a stream of text blocks.
+
+        Blocks are parsed on a background thread while earlier chunks are embedded,
+        and chunks are embedded and inserted in bounded batches, so memory use stays
+        flat regardless of the document's size.
+        """
         start_time = time.time()
+        self.sync()
+        
+        # The same file was ingested before, reuse it instead of storing a copy
+        file_hash = document['metadata'].get('file_hash')
+        if file_hash:
+            existing_id = self.embedding_store.get_document(file_hash)
+            if existing_id and self._has_document(existing_id):
+                print(f"Document already stored as {existing_id}, skipping ingestion")
+                return existing_id
+        
+        # Generate a unique ID for the document
+        doc_id = str(uuid.uuid4())
+        
+        if not isinstance(blocks, (list, tuple)):
+            blocks = prefetch(blocks, config.INGEST_PREFETCH_BLOCKS, name="ingest")
+        
+        chunk_count = 0
+        batch = []
+        try:
+            for chunk in self._iter_chunks(blocks):
+                batch.append(chunk)
+                if len(batch) >= config.INGEST_BATCH_CHUNKS:
+                    self._add_chunks(doc_id, filename, document, batch, chunk_count)
+                    chunk_count += len(batch)
+                    batch = []
+                    if progress:
+                        progress(chunks_embedded=chunk_count)
+            if batch:
+                self._add_chunks(doc_id, filename, document, batch, chunk_count)
+                chunk_count += len(batch)
+        except Exception:
+            # Don't leave a partially indexed document behind
+            self._delete_chunks(doc_id)
+            self.keyword_index.remove_document(doc_id)
+            self.embedding_store.record_change(doc_id)
+            raise
         
-        # Generate query embedding
-        query_embedding = self._encode_text(query)
+        if not chunk_count:
+            raise ValueError("No text could be extracted from the document")
+        if progress:
+            progress(chunks_embedded=chunk_count, chunks_total=chunk_count)
+        self.keyword_index.save_document(doc_id)
+        if file_hash:
+            self.embedding_store.put_document(file_hash, doc_id, filename)
+        self.embedding_store.record_change(doc_id)
         
-        # Prepare where clause if document_id is provided
-        where = {"doc_id": document_id} if document_id else None
+        processing_time = time.time() - start_time
+        print(f"Document storage took {processing_time:.2f} seconds for {chunk_count} chunks")
         
-        # Search in ChromaDB with increased results
-        results = self.collection.query(
+        return doc_id
+
+    def _query_collection(self, collection, query_embedding: List[float], top_k: int,
+                          where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        results = collection.query(
             query_embeddings=[query_embedding],
             n_results=top_k,
             where=where
         )
         
-        # Format results and sort by relevance
         formatted_results = []
         for i in range(len(results['documents'][0])):
             formatted_results.append({
+                "id": results['ids'][0][i],
                 "content": results['documents'][0][i],
                 "metadata": results['metadatas'][0][i],
                 "distance": results['distances'][0][i] if 'distances' in results else None
             })
+        return formatted_results
+
+    def _vector_search(self, query: str, doc_ids: Optional[List[str]], top_k: int) -> List[Dict[str, Any]]:
+        """Nearest chunks by embedding across the given documents (all if None), closest first."""
+        query_embedding = self.encode_query(query).tolist()
+        
+        if doc_ids is None:
+            # The whole corpus: every shard, unfiltered
+            searches = [(shard, None) for shard in self._shards]
+            if self._legacy_documents:
+                searches.append((self.collection, None))
+        else:
+            # Only the shards holding the documents, filtered down to them
+            by_collection = {}
+            for doc_id in doc_ids:
+                collection = self._collection_for(doc_id)
+                by_collection.setdefault(collection.name, (collection, []))[1].append(doc_id)
+            searches = [
+                (collection, {"doc_id": ids[0]} if len(ids) == 1 else {"doc_id": {"$in": ids}})
+                for collection, ids in by_collection.values()
+            ]
+        
+        # Every shard returns its own top_k; cosine distances are comparable across them
+        if len(searches) == 1:
+            partitions = [self._query_collection(searches[0][0], query_embedding, top_k, searches[0][1])]
+        else:
+            partitions = self._search_executor.map(
+                lambda search: self._query_collection(search[0], query_embedding, top_k, search[1]),
+                searches
+            )
+        formatted_results = [result for partition in partitions for result in partition]
         
         # Sort by distance (lower is better)
         formatted_results.sort(key=lambda x: x['distance'] if x['distance'] is not None else float('inf'))
+        return formatted_results[:top_k]
+
+    def _ensure_keyword_index(self, document_id: str):
+        """Build the keyword index of a document stored before keyword search existed."""
+        if self.keyword_index.has_document(document_id) or document_id not in self._legacy_documents:
+            return
+        stored = self.collection.get(where={"doc_id": document_id}, include=["documents"])
+        if stored['ids']:
+            self.keyword_index.add_chunks(document_id, stored['ids'], stored['documents'])
+            self.keyword_index.save_document(document_id)
+
+    def _fetch_chunks(self, chunk_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Content and metadata of chunks by id."""
+        # Chunk ids are "<doc_id>_<chunk index>"
+        by_collection = {}
+        for chunk_id in chunk_ids:
+            collection = self._collection_for(chunk_id.rsplit("_", 1)[0])
+            by_collection.setdefault(collection.name, (collection, []))[1].append(chunk_id)
+        
+        chunks = {}
+        for collection, ids in by_collection.values():
+            stored = collection.get(ids=ids, include=["documents", "metadatas"])
+            for chunk_id, content, metadata in zip(stored['ids'], stored['documents'], stored['metadatas']):
+                chunks[chunk_id] = {"id": chunk_id, "content": content, "metadata": metadata, "distance": None}
+        return chunks
+
+    def search(self, query: str, document_id: Union[str, List[str], None] = None, top_k: Optional[int] = None,
+               mode: Optional[str] = None, rerank: Optional[bool] = None) -> List[Dict[str, Any]]:
+        """Search for relevant content.
+
+        document_id is a document id, a list of them, or None to search every document.
+        mode is "vector" (embedding similarity), "keyword" (BM25) or "hybrid", which
+        merges both rankings with reciprocal-rank fusion; it defaults to config.SEARCH_MODE.
+        With reranking (config.RERANK_ENABLED unless rerank says otherwise),
+        RERANK_CANDIDATES results are reordered by the cross-encoder and only the best
+        top_k (default RERANK_TOP_K) are returned.
+        """
+        self.sync()
+        rerank = config.RERANK_ENABLED if rerank is None else rerank
+        if rerank and self.reranker is not None:
+            top_k = top_k or config.RERANK_TOP_K
+            candidates = self._retrieve(query, document_id, max(top_k, config.RERANK_CANDIDATES), mode)
+            return self.reranker.rerank(query, candidates, top_k)
+        return self._retrieve(query, document_id, top_k or 5, mode)
+
+    def _retrieve(self, query: str, document_id: Union[str, List[str], None], top_k: int,
+                  mode: Optional[str]) -> List[Dict[str, Any]]:
+        """First-stage retrieval by vector, keyword or hybrid ranking."""
+        start_time = time.time()
+        doc_ids = [document_id] if isinstance(document_id, str) else document_id
+        mode = mode or config.SEARCH_MODE
+        if mode not in ("vector", "keyword", "hybrid"):
+            raise ValueError(f"Unsupported search mode: {mode}")
+        
+        if mode == "vector":
+            formatted_results = self._vector_search(query, doc_ids, top_k)
+            print(f"Vector search took {time.time() - start_time:.2f} seconds")
+            return formatted_results
+        
+        for doc_id in doc_ids or []:
+            self._ensure_keyword_index(doc_id)
+        
+        # Fusion looks deeper into both rankings than the results it returns
+        candidates = top_k if mode == "keyword" else max(top_k, config.HYBRID_CANDIDATES)
+        keyword_hits = self.keyword_index.search(query, candidates, doc_ids)
+        keyword_time = time.time() - start_time
+        
+        if mode == "keyword":
+            chunks = self._fetch_chunks([chunk_id for chunk_id, _ in keyword_hits])
+            formatted_results = []
+            for chunk_id, score in keyword_hits:
+                if chunk_id in chunks:
+                    formatted_results.append({**chunks[chunk_id], "score": round(score, 4)})
+            print(f"Keyword search took {keyword_time * 1000:.1f} ms")
+            return formatted_results
+        
+        vector_results = self._vector_search(query, doc_ids, candidates)
+        
+        # Reciprocal-rank fusion: score = sum of 1 / (k + rank) over both rankings
+        scores = {}
+        for rank, result in enumerate(vector_results):
+            scores[result['id']] = scores.get(result['id'], 0.0) + 1.0 / (config.RRF_K + rank + 1)
+        for rank, (chunk_id, _) in enumerate(keyword_hits):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (config.RRF_K + rank + 1)
+        ranked = sorted(scores, key=scores.get, reverse=True)[:top_k]
+        
+        chunks = {result['id']: result for result in vector_results}
+        chunks.update(self._fetch_chunks([chunk_id for chunk_id in ranked if chunk_id not in chunks]))
+        formatted_results = [
+            {**chunks[chunk_id], "score": round(scores[chunk_id], 6)}
+            for chunk_id in ranked if chunk_id in chunks
+        ]
         
         processing_time = time.time() - start_time
-        print(f"Vector search took {processing_time:.2f} seconds")
+        print(f"Hybrid search took {processing_time:.2f} seconds (keyword {keyword_time * 1000:.1f} ms)")
         
         return formatted_results
 
     def delete_document(self, document_id: str) -> bool:
         """Delete a document and its chunks from the vector database."""
         try:
-            self.collection.delete(
-                where={"doc_id": document_id}
-            )
+            self.sync()
+            self._delete_chunks(document_id)
+            self._legacy_documents.discard(document_id)
+            self.embedding_store.delete_document(document_id)
+            self.keyword_index.remove_document(document_id)
+            self.embedding_store.record_change(document_id)
             return True
         except Exception as e:
             print(f"Error deleting document: {e}")
@@ -5,56 +5,175 @@ import sounddevice as sd
 from transformers import Wav2Vec2ForCTC, Wav2Vec2Processor
 from transformers import VitsModel, AutoTokenizer
 import numpy as np
-from typing import Optional
+import re
+import struct
+import time
+from collections import deque
+from math import gcd
+from scipy.signal import resample_poly
+import config
+from audio_cache import AudioCache
+from batching import MicroBatcher
+import model_registry
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
 
 class VoiceEngine:
-    def __init__(self):
-        # Initialize speech-to-text model
-        self.stt_model_name = "facebook/wav2vec2-base-960h"
-        self.stt_processor = Wav2Vec2Processor.from_pretrained(self.stt_model_name)
-        self.stt_model = Wav2Vec2ForCTC.from_pretrained(self.stt_model_name)
-        
-        # Initialize text-to-speech model
-        self.tts_model_name = "facebook/mms-tts-eng"
-        self.tts_tokenizer = AutoTokenizer.from_pretrained(self.tts_model_name)
-        self.tts_model = VitsModel.from_pretrained(self.tts_model_name)
-        
+    # Speech-to-text and text-to-speech models
+    stt_model_name = "facebook/wav2vec2-base-960h"
+    tts_model_name = "facebook/mms-tts-eng"
+
+    @classmethod
+    def load_models(cls) -> Dict[str, Any]:
+        """The engine's processors and models, from the process-wide model registry."""
         # Move models to GPU if available
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.stt_model.to(self.device)
-        self.tts_model.to(self.device)
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        return {
+            "stt_processor": model_registry.get_model(
+                f"processor:{cls.stt_model_name}", lambda: Wav2Vec2Processor.from_pretrained(cls.stt_model_name)
+            ),
+            "stt_model": model_registry.get_model(
+                f"stt:{cls.stt_model_name}", lambda: Wav2Vec2ForCTC.from_pretrained(cls.stt_model_name).to(device)
+            ),
+            "tts_tokenizer": model_registry.get_model(
+                f"tokenizer:{cls.tts_model_name}", lambda: AutoTokenizer.from_pretrained(cls.tts_model_name)
+            ),
+            "tts_model": model_registry.get_model(
+                f"tts:{cls.tts_model_name}", lambda: VitsModel.from_pretrained(cls.tts_model_name).to(device)
+            ),
+            "device": device,
+        }
+
+    def __init__(self):
+        models = self.load_models()
+        self.stt_processor = models["stt_processor"]
+        self.stt_model = models["stt_model"]
+        self.tts_tokenizer = models["tts_tokenizer"]
+        self.tts_model = models["tts_model"]
+        self.device = models["device"]
         
         # Create output directory for audio files
         os.makedirs("audio_output", exist_ok=True)
+        
+        # Synthesized speech is reused across requests and restarts
+        self.audio_cache = AudioCache("audio_output", max_bytes=config.TTS_CACHE_MAX_BYTES)
+        
+        # Audio windows from all concurrent transcriptions share wav2vec2 forward passes
+        self.stt_sampling_rate = self.stt_processor.feature_extractor.sampling_rate
+        self.stt_batcher = MicroBatcher(
+            self._transcribe_batch,
+            max_batch_size=config.STT_BATCH_SIZE,
+            max_wait=config.STT_MAX_WAIT_MS / 1000,
+            name="stt"
+        )
 
-    def speech_to_text(self, audio_file_path: str) -> str:
-        """Convert speech to text using Wav2Vec2."""
-        # Load audio file
-        audio_input, sample_rate = sf.read(audio_file_path)
+    def load_audio(self, audio_file_path: Union[str, BinaryIO]) -> np.ndarray:
+        """Read an audio file (path or file object) as mono float32 at the speech model's sampling rate."""
+        audio, sample_rate = sf.read(audio_file_path, dtype="float32", always_2d=True)
+        audio = audio.mean(axis=1)
+        if sample_rate != self.stt_sampling_rate:
+            factor = gcd(sample_rate, self.stt_sampling_rate)
+            audio = resample_poly(audio, self.stt_sampling_rate // factor, sample_rate // factor).astype(np.float32)
+        return audio
+
+    def _windows(self, audio: np.ndarray) -> Iterator[Tuple[np.ndarray, int, int]]:
+        """Split audio into overlapping windows of STT_CHUNK_SECONDS.
+
+        Consecutive windows overlap by twice STT_STRIDE_SECONDS; each window's
+        (left, right) stride in samples is the part whose predictions are dropped,
+        since the model sees too little context there.
+        """
+        chunk = int(config.STT_CHUNK_SECONDS * self.stt_sampling_rate)
+        stride = int(config.STT_STRIDE_SECONDS * self.stt_sampling_rate)
+        if chunk <= 2 * stride:
+            raise ValueError("STT_CHUNK_SECONDS must be more than twice STT_STRIDE_SECONDS")
         
-        # Process audio input
+        for start in range(0, len(audio), chunk - 2 * stride):
+            end = start + chunk
+            yield audio[start:end], 0 if start == 0 else stride, 0 if end >= len(audio) else stride
+            if end >= len(audio):
+                break
+
+    def _transcribe_batch(self, windows: List[Tuple[np.ndarray, int, int]]) -> List[np.ndarray]:
+        """Predicted CTC token ids of each window, without its strides, in one padded forward pass."""
         inputs = self.stt_processor(
-            audio_input, 
-            sampling_rate=sample_rate, 
-            return_tensors="pt", 
+            [samples for samples, _, _ in windows],
+            sampling_rate=self.stt_sampling_rate,
+            return_tensors="pt",
             padding=True
         )
-        
-        # Move inputs to device
         inputs = {k: v.to(self.device) for k, v in inputs.items()}
         
-        # Perform inference
         with torch.no_grad():
             logits = self.stt_model(**inputs).logits
+        predicted_ids = torch.argmax(logits, dim=-1).cpu().numpy()
         
-        # Decode the output
-        predicted_ids = torch.argmax(logits, dim=-1)
-        transcription = self.stt_processor.batch_decode(predicted_ids)
+        # Logit frames per input sample (wav2vec2: one frame per 320 samples)
+        ratio = logits.shape[1] / inputs["input_values"].shape[1]
+        results = []
+        for ids, (samples, left, right) in zip(predicted_ids, windows):
+            frames = int(round(len(samples) * ratio))
+            results.append(ids[int(round(left * ratio)):frames - int(round(right * ratio))])
+        return results
+
+    def ctc_decode(self, token_ids: List[np.ndarray]) -> str:
+        """Text of consecutive windows' token ids; CTC merges repeats across window boundaries too."""
+        if not token_ids:
+            return ""
+        return self.stt_processor.decode(np.concatenate(token_ids))
+
+    def speech_to_text_stream(self, audio_file_path: Union[str, BinaryIO]) -> Iterator[str]:
+        """Yield the transcript so far each time another window of the recording is decoded.
+
+        Long recordings are transcribed in overlapping windows instead of in one
+        pass, whose memory grows with the square of the length. A few windows
+        are kept in flight so they are batched together (and with other requests).
+        """
+        audio = self.load_audio(audio_file_path)
+        start_time = time.time()
         
-        return transcription[0]
+        pending = deque()
+        token_ids = []
+        for window in self._windows(audio):
+            pending.append(self.stt_batcher.submit(window))
+            if len(pending) < config.STT_BATCH_SIZE:
+                continue
+            token_ids.append(pending.popleft().result())
+            yield self.ctc_decode(token_ids)
+        while pending:
+            token_ids.append(pending.popleft().result())
+            yield self.ctc_decode(token_ids)
+        
+        print(f"Transcribed {len(audio) / self.stt_sampling_rate:.1f} seconds of audio "
+              f"in {time.time() - start_time:.2f} seconds")
+
+    def speech_to_text(self, audio_file_path: Union[str, BinaryIO]) -> str:
+        """Convert speech to text using Wav2Vec2."""
+        transcription = ""
+        for transcription in self.speech_to_text_stream(audio_file_path):
+            pass
+        return transcription
+
+    def _cache_key(self, text: str) -> str:
+        return AudioCache.make_key(text, self.tts_model_name, self.tts_model.config.sampling_rate)
+
+    def _write_cached(self, key: str, audio: np.ndarray) -> str:
+        """Write audio into the cache atomically and return its path."""
+        output_file = self.audio_cache.path_for(key)
+        temp_file = f"{output_file}.{os.getpid()}.tmp"
+        sf.write(temp_file, audio, self.tts_model.config.sampling_rate, format="WAV")
+        os.replace(temp_file, output_file)
+        self.audio_cache.add(key)
+        return output_file
 
     def text_to_speech(self, text: str, output_file: Optional[str] = None) -> str:
         """Convert text to speech using VITS model."""
+        # Identical text was already synthesized, reuse the file
+        if output_file is None:
+            key = self._cache_key(text)
+            cached_file = self.audio_cache.get(key)
+            if cached_file:
+                return cached_file
+        
         # Tokenize text
         inputs = self.tts_tokenizer(text, return_tensors="pt")
         inputs = {k: v.to(self.device) for k, v in inputs.items()}
@@ -66,15 +185,101 @@ class VoiceEngine:
         # Convert to numpy array
         audio = output.cpu().numpy().squeeze()
         
-        # Generate output filename if not provided
+        # Store in the cache unless an explicit output file was requested
         if output_file is None:
-            output_file = f"audio_output/tts_{hash(text)}.wav"
+            return self._write_cached(key, audio)
         
         # Save audio file
         sf.write(output_file, audio, self.tts_model.config.sampling_rate)
         
         return output_file
 
+    SENTENCE_END = re.compile(r'(?<=[.!?;:])\s+')
+
+    def split_sentences(self, text: str) -> List[str]:
+        """Split text into sentences for incremental synthesis."""
+        sentences = self.SENTENCE_END.split(text.strip())
+        return [sentence.strip() for sentence in sentences if sentence.strip()]
+
+    def pop_sentences(self, text: str) -> Tuple[List[str], str]:
+        """Split the complete sentences off text that is still being generated.
+
+        Returns the sentences and the unfinished rest; a sentence only counts as
+        complete once the text continues after its final punctuation.
+        """
+        parts = self.SENTENCE_END.split(text)
+        return [part.strip() for part in parts[:-1] if part.strip()], parts[-1]
+
+    def _synthesize_batch(self, sentences: List[str]) -> List[np.ndarray]:
+        """Synthesize several sentences in one padded VITS forward pass."""
+        inputs = self.tts_tokenizer(sentences, return_tensors="pt", padding=True)
+        inputs = {k: v.to(self.device) for k, v in inputs.items()}
+        
+        with torch.no_grad():
+            output = self.tts_model(**inputs)
+        
+        # Trim each waveform back to its own length before handing it out
+        waveforms = output.waveform.cpu().numpy()
+        lengths = output.sequence_lengths.cpu().numpy()
+        return [waveforms[i, :int(lengths[i])] for i in range(len(sentences))]
+
+    def iter_speech(self, text: str, batch_size: Optional[int] = None) -> Iterator[np.ndarray]:
+        """Yield the waveform of each sentence of text, in order."""
+        batch_size = batch_size or config.TTS_STREAM_BATCH_SIZE
+        sentences = self.split_sentences(text)
+        if not sentences:
+            return
+        
+        # The first sentence goes alone so playback can start as early as possible
+        yield from self._synthesize_batch(sentences[:1])
+        for i in range(1, len(sentences), batch_size):
+            yield from self._synthesize_batch(sentences[i:i + batch_size])
+
+    @staticmethod
+    def _to_pcm16(audio: np.ndarray) -> bytes:
+        """Convert a float waveform to little-endian 16-bit PCM."""
+        return (np.clip(audio, -1.0, 1.0) * 32767).astype('<i2').tobytes()
+
+    def sentence_pcm(self, sentence: str) -> bytes:
+        """Speech for a single sentence as 16-bit PCM."""
+        return self._to_pcm16(self._synthesize_batch([sentence])[0])
+
+    @staticmethod
+    def streaming_wav_header(sample_rate: int, channels: int = 1, bits_per_sample: int = 16) -> bytes:
+        """WAV header with open-ended sizes, for audio whose length isn't known yet."""
+        byte_rate = sample_rate * channels * bits_per_sample // 8
+        block_align = channels * bits_per_sample // 8
+        return (
+            b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate, byte_rate, block_align, bits_per_sample)
+            + b"data" + struct.pack("<I", 0xFFFFFFFF)
+        )
+
+    def text_to_speech_stream(self, text: str, audio_format: str = "wav") -> Iterator[bytes]:
+        """Yield speech for text sentence by sentence as WAV (header first) or raw PCM bytes."""
+        if audio_format not in ("wav", "pcm"):
+            raise ValueError(f"Unsupported audio format: {audio_format}")
+        
+        if audio_format == "wav":
+            yield self.streaming_wav_header(self.tts_model.config.sampling_rate)
+        
+        # Replay cached speech instead of synthesizing it again
+        key = self._cache_key(text)
+        cached_file = self.audio_cache.get(key)
+        if cached_file:
+            audio, _ = sf.read(cached_file, dtype="float32")
+            yield self._to_pcm16(audio)
+            return
+        
+        pieces = []
+        for audio in self.iter_speech(text):
+            pieces.append(audio)
+            yield self._to_pcm16(audio)
+        
+        # Only complete streams make it into the cache
+        if pieces:
+            self._write_cached(key, np.concatenate(pieces))
+
     def record_audio(self, duration: int = 5, sample_rate: int = 16000) -> str:
         """Record audio from microphone."""
         print(f"Recording for {duration} seconds...")
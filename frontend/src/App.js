@@ -65,9 +65,23 @@ function App() {
         throw new Error(errorData.detail || 'Failed to upload document');
       }
 
-      const data = await response.json();
+      // Processing runs in the background; poll the job until it finishes
+      let job = await response.json();
+      while (job.status !== 'completed') {
+        if (job.status === 'failed') {
+          throw new Error(job.error || 'Failed to process document');
+        }
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        const jobResponse = await fetch(`http://localhost:8000/jobs/${job.job_id || job.id}`);
+        if (!jobResponse.ok) {
+          const errorData = await jobResponse.json();
+          throw new Error(errorData.detail || 'Failed to check document status');
+        }
+        job = await jobResponse.json();
+      }
+
       setCurrentDocument({
-        id: data.document_id,
+        id: job.document_id,
         name: file.name,
       });
       setResponses([{
@@ -94,7 +108,7 @@ function App() {
     try {
       setResponses(prev => [...prev, { type: 'user', content: query }]);
 
-      const response = await fetch('http://localhost:8000/query', {
+      const response = await fetch('http://localhost:8000/query/stream', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -110,17 +124,53 @@ function App() {
         throw new Error(errorData.detail || 'Failed to process query');
       }
 
-      const data = await response.json();
-      
-      setResponses(prev => [
-        ...prev,
-        {
-          type: data.type || 'assistant',
-          content: data.response,
-          audioUrl: data.audio_url,
-          context: data.context
+      // Show the answer as it streams in and fill in context/audio when they arrive
+      setResponses(prev => [...prev, { type: 'assistant', content: '' }]);
+      const updateAnswer = (changes) => {
+        setResponses(prev => {
+          const updated = [...prev];
+          const last = updated[updated.length - 1];
+          updated[updated.length - 1] = { ...last, ...changes(last) };
+          return updated;
+        });
+      };
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let finished = false;
+
+      while (!finished) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        const messages = buffer.split('\n\n');
+        buffer = messages.pop();
+        for (const message of messages) {
+          let event = 'message';
+          let data = '';
+          for (const line of message.split('\n')) {
+            if (line.startsWith('event: ')) event = line.slice(7);
+            else if (line.startsWith('data: ')) data += line.slice(6);
+          }
+          const payload = data ? JSON.parse(data) : {};
+
+          if (event === 'token') {
+            updateAnswer(last => ({ content: last.content + payload.text }));
+          } else if (event === 'response') {
+            updateAnswer(() => ({ type: payload.type || 'assistant', content: payload.response }));
+          } else if (event === 'context') {
+            updateAnswer(() => ({ context: payload }));
+          } else if (event === 'audio') {
+            updateAnswer(() => ({ audioUrl: payload.audio_url }));
+          } else if (event === 'error') {
+            throw new Error(payload.detail || 'Failed to process query');
+          } else if (event === 'done') {
+            finished = true;
+          }
         }
-      ]);
+      }
     } catch (error) {
       handleError(error, 'Error processing query');
     } finally {
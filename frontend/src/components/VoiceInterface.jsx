@@ -1,5 +1,4 @@
-import React, { useState, useEffect } from 'react';
-import SpeechRecognition, { useSpeechRecognition } from 'react-speech-recognition';
+import React, { useState, useEffect, useRef } from 'react';
 import {
   Box,
   TextField,
@@ -12,39 +11,133 @@ import MicIcon from '@mui/icons-material/Mic';
 import MicOffIcon from '@mui/icons-material/MicOff';
 import SendIcon from '@mui/icons-material/Send';
 
+const SPEECH_SOCKET_URL = 'ws://localhost:8000/ws/speech-to-text';
+// The speech model's sampling rate; the server resamples if the browser can't record at it
+const SAMPLE_RATE = 16000;
+
+const toPcm16 = (samples) => {
+  const pcm = new Int16Array(samples.length);
+  for (let i = 0; i < samples.length; i++) {
+    const sample = Math.max(-1, Math.min(1, samples[i]));
+    pcm[i] = sample < 0 ? sample * 0x8000 : sample * 0x7fff;
+  }
+  return pcm.buffer;
+};
+
 const VoiceInterface = ({ onQuery, isProcessing }) => {
   const [query, setQuery] = useState('');
   const [isListening, setIsListening] = useState(false);
   const [audioElement, setAudioElement] = useState(null);
+  const [partial, setPartial] = useState('');
+  const [error, setError] = useState(null);
+  const recording = useRef(null);
+
+  const browserSupportsRecording = Boolean(navigator.mediaDevices && navigator.mediaDevices.getUserMedia);
+
+  const stopAudio = (current) => {
+    if (!current || current.audioStopped) {
+      return;
+    }
+    current.audioStopped = true;
+    current.processor.disconnect();
+    current.source.disconnect();
+    current.stream.getTracks().forEach(track => track.stop());
+    current.context.close();
+  };
+
+  // Release the microphone and connection if the component goes away mid-recording
+  useEffect(() => () => {
+    stopAudio(recording.current);
+    if (recording.current) {
+      recording.current.socket.close();
+    }
+  }, []);
 
-  const {
-    transcript,
-    listening,
-    resetTranscript,
-    browserSupportsSpeechRecognition
-  } = useSpeechRecognition();
+  const openSource = (stream) => {
+    // Record at 16 kHz where the browser allows it, otherwise at its own rate
+    const context = new AudioContext({ sampleRate: SAMPLE_RATE });
+    try {
+      return { context, source: context.createMediaStreamSource(stream) };
+    } catch (e) {
+      context.close();
+      const fallback = new AudioContext();
+      return { context: fallback, source: fallback.createMediaStreamSource(stream) };
+    }
+  };
 
-  useEffect(() => {
-    if (transcript) {
-      setQuery(transcript);
+  const handleStartListening = async () => {
+    setError(null);
+    let stream;
+    try {
+      stream = await navigator.mediaDevices.getUserMedia({ audio: { channelCount: 1, echoCancellation: true } });
+    } catch (e) {
+      setError('Microphone access was denied.');
+      return;
     }
-  }, [transcript]);
 
-  const handleStartListening = () => {
+    const { context, source } = openSource(stream);
+    const socket = new WebSocket(`${SPEECH_SOCKET_URL}?sample_rate=${context.sampleRate}`);
+    socket.binaryType = 'arraybuffer';
+
+    socket.onmessage = (event) => {
+      const message = JSON.parse(event.data);
+      if (message.type === 'partial') {
+        setPartial(message.text.toLowerCase());
+      } else if (message.type === 'final') {
+        // The question is ready as soon as the speaker stops
+        setPartial('');
+        // wav2vec2 transcribes in capitals
+        const text = message.text.toLowerCase();
+        setQuery(prev => (prev ? `${prev} ${text}` : text));
+        if (recording.current && recording.current.stopping) {
+          socket.close();
+        }
+      }
+    };
+    socket.onerror = () => setError('Lost connection to the speech recognizer.');
+    socket.onclose = () => {
+      // A new recording may have started while this one was waiting for its final transcript
+      if (recording.current && recording.current.socket !== socket) {
+        return;
+      }
+      stopAudio(recording.current);
+      recording.current = null;
+      setIsListening(false);
+      setPartial('');
+    };
+
+    const processor = context.createScriptProcessor(2048, 1, 1);
+    processor.onaudioprocess = (event) => {
+      if (socket.readyState === WebSocket.OPEN) {
+        socket.send(toPcm16(event.inputBuffer.getChannelData(0)));
+      }
+    };
+    source.connect(processor);
+    processor.connect(context.destination);
+
+    recording.current = { stream, context, source, processor, socket, stopping: false, audioStopped: false };
     setIsListening(true);
-    SpeechRecognition.startListening({ continuous: true });
   };
 
   const handleStopListening = () => {
+    const current = recording.current;
     setIsListening(false);
-    SpeechRecognition.stopListening();
+    if (!current) {
+      return;
+    }
+    stopAudio(current);
+    // Ask for the final transcript of what was said last, then hang up
+    current.stopping = true;
+    if (current.socket.readyState === WebSocket.OPEN) {
+      current.socket.send(JSON.stringify({ type: 'end' }));
+      setTimeout(() => current.socket.close(), 3000);
+    }
   };
 
   const handleSubmit = async () => {
     if (query.trim()) {
       await onQuery(query);
       setQuery('');
-      resetTranscript();
     }
   };
 
@@ -64,11 +157,11 @@ const VoiceInterface = ({ onQuery, isProcessing }) => {
     audio.play();
   };
 
-  if (!browserSupportsSpeechRecognition) {
+  if (!browserSupportsRecording) {
     return (
       <Box>
         <Typography color="error">
-          Your browser doesn't support speech recognition. Please use a modern browser.
+          Your browser doesn't support audio recording. Please use a modern browser.
         </Typography>
       </Box>
     );
@@ -121,7 +214,13 @@ const VoiceInterface = ({ onQuery, isProcessing }) => {
 
       {isListening && (
         <Typography variant="caption" color="textSecondary" sx={{ mt: 1, display: 'block' }}>
-          Listening... {transcript}
+          Listening... {partial}
+        </Typography>
+      )}
+
+      {error && (
+        <Typography variant="caption" color="error" sx={{ mt: 1, display: 'block' }}>
+          {error}
         </Typography>
       )}
     </Box>